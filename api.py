@@ -0,0 +1,150 @@
+"""JSON API for scripts and tools, under /api/v1.
+
+It uses the same session cookie as the site (log in through /login) and
+answers 401 instead of redirecting. GET responses carry ETags, and a
+matching If-None-Match gets an empty 304.
+
+    GET  /api/v1/challenges            active challenges
+    GET  /api/v1/progress              your score, rank and solved challenge ids
+    GET  /api/v1/scoreboard            ranked players; admins page with ?cursor=&limit=
+    POST /api/v1/submissions           {"flags": [{"challenge_id": 1, "flag": "..."}, ...]}
+
+The submissions endpoint checks up to API_BATCH_SIZE flags and records
+them in one transaction, returning one result per flag in order.
+"""
+import hashlib
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from extensions import catalog, leaderboard, submissions
+from routes import cached_response, publish_score
+from submissions import CORRECT
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+NOT_FOUND = 'not_found'
+
+
+def error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+def http_error(e):
+    # Unknown URLs and methods under /api/ are routing errors, raised outside the blueprint
+    if request.blueprint == api.name or request.path.startswith(api.url_prefix + '/'):
+        return error(e.code, e.description)
+    return e
+
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error(401, 'Login required')
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _entry(entry):
+    return {'rank': entry.rank, 'user_id': entry.user_id, 'username': entry.username, 'score': entry.score}
+
+
+@api.route('/challenges')
+@api_login_required
+def challenges():
+    # The same for every player, so one ETag per catalog version
+    version, updated_at = catalog.version()
+    return cached_response(f'api-catalog-{version}', updated_at, lambda: jsonify({'challenges': [
+        {'id': entry.id, 'title': entry.title, 'category': entry.category,
+         'points': entry.points, 'value': entry.value}
+        for entry in catalog.active()
+    ]}))
+
+
+@api.route('/progress')
+@api_login_required
+def progress():
+    solved = sorted(submissions.solved(current_user.id))
+    entry = leaderboard.entry(current_user.id)
+    body = {
+        'user_id': current_user.id,
+        'username': current_user.username,
+        'score': entry.score if entry else current_user.score or 0,
+        'rank': entry.rank if entry else None,
+        'solved': solved,
+    }
+    etag = 'api-progress-' + hashlib.sha1(repr(sorted(body.items())).encode('utf-8')).hexdigest()
+    return cached_response(etag, None, lambda: jsonify(body))
+
+
+def _parse_cursor(cursor):
+    score, _, user_id = cursor.partition(':')
+    try:
+        return int(score), int(user_id)
+    except ValueError:
+        return None
+
+
+@api.route('/scoreboard')
+@api_login_required
+def scoreboard():
+    """Admins page through everyone; players get the rows the scoreboard page shows them."""
+    if current_user.role == 'admin':
+        limit = min(max(request.args.get('limit', current_app.config['SCOREBOARD_PAGE_SIZE'], type=int), 1),
+                    current_app.config['API_SCOREBOARD_MAX_LIMIT'])
+        cursor = request.args.get('cursor')
+        if cursor:
+            position = _parse_cursor(cursor)
+            if position is None:
+                return error(400, 'Invalid cursor')
+            entries, total = leaderboard.after(*position, limit)
+        else:
+            entries, total = leaderboard.page(1, limit)
+        last = entries[-1] if len(entries) == limit else None
+        next_cursor = f'{last.score}:{last.user_id}' if last else None
+    else:
+        entries = leaderboard.around(current_user, current_app.config['SCOREBOARD_AROUND_ME'])
+        total, next_cursor = len(leaderboard), None
+    body = {'total': total, 'entries': [_entry(entry) for entry in entries], 'next_cursor': next_cursor}
+    etag = 'api-scoreboard-' + hashlib.sha1(repr(body).encode('utf-8')).hexdigest()
+    return cached_response(etag, None, lambda: jsonify(body))
+
+
+@api.route('/submissions', methods=['POST'])
+@api_login_required
+def submit_flags():
+    payload = request.get_json(silent=True)
+    flags = payload.get('flags') if isinstance(payload, dict) else None
+    if not isinstance(flags, list) or not flags:
+        return error(400, 'Expected {"flags": [{"challenge_id": ..., "flag": ...}, ...]}')
+    if len(flags) > current_app.config['API_BATCH_SIZE']:
+        return error(400, f'At most {current_app.config["API_BATCH_SIZE"]} flags per request')
+    attempts = []
+    for item in flags:
+        if not isinstance(item, dict) or not isinstance(item.get('challenge_id'), int) \
+                or not isinstance(item.get('flag'), str) or not item['flag'].strip():
+            return error(400, 'Each flag needs an integer challenge_id and a non-empty flag')
+        attempts.append((item['challenge_id'], item['flag'].strip()))
+
+    results = submissions.submit_many(current_user, attempts)
+    known = [result for result in results if result is not None]
+    if any(result.status == CORRECT for result in known):
+        publish_score(current_user, known[0])
+    return jsonify({
+        'score': known[0].score if known else current_user.score or 0,
+        'results': [
+            {'challenge_id': challenge_id, 'status': result.status if result else NOT_FOUND,
+             'points': result.points if result else 0}
+            for (challenge_id, _), result in zip(attempts, results)
+        ],
+    })
+
+
+def init_api(app):
+    app.register_blueprint(api)
+    app.register_error_handler(HTTPException, http_error)
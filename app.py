@@ -1,21 +1,40 @@
 from flask import Flask
 from config import Config
-from extensions import db
+from storage import init_storage
+from startup import init_template_cache, start
+from extensions import db, leaderboard, scoreboard_feed, catalog, media_store, derivatives, submissions, submission_queue, dashboard_stats, metrics, password_hasher, user_cache, score_timeline
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
     # Initialize extensions with app
+    init_storage(app)
     db.init_app(app)
+    leaderboard.init_app(app)
+    scoreboard_feed.init_app(app)
+    catalog.init_app(app)
+    media_store.init_app(app)
+    derivatives.init_app(app)
+    submissions.init_app(app)
+    submission_queue.init_app(app)
+    dashboard_stats.init_app(app)
+    metrics.init_app(app)
+    password_hasher.init_app(app)
+    user_cache.init_app(app)
+    score_timeline.init_app(app)
     
     # Import routes after app is created to avoid circular imports
     from routes import init_routes
+    from api import init_api
+    from commands import init_commands
     init_routes(app)
+    init_api(app)
+    init_commands(app)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Cache compiled templates, create database tables and bring older databases up to date (see startup.py)
+    init_template_cache(app)
+    start(app)
     
     return app
 
@@ -0,0 +1,315 @@
+"""Replay an event-day traffic mix against a local gunicorn.
+
+Seeds a throwaway SQLite database with --users players and --challenges
+challenges, starts gunicorn on it and runs --clients concurrent players for
+--duration seconds. Each player logs in and then loops over a weighted mix
+of logins, /challenges views, flag submissions and scoreboard polls. The
+server runs the app through instrumented_app(), which reports the number of
+SQL statements each request executed in an X-DB-Queries header.
+
+Reports throughput plus p50/p95/p99 latency and queries per request for
+every route. --json saves the run; --baseline prints the change against a
+saved run.
+
+Usage: python bench_event_load.py [--users 500] [--challenges 30] [--clients 50]
+                                  [--duration 30] [--workers 2] [--threads 8]
+                                  [--mix login=5,challenges=40,submit=25,scoreboard=30]
+                                  [--json results.json] [--baseline before.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+PASSWORD = 'password123'
+ROUTES = ('login', 'challenges', 'submit', 'scoreboard')
+
+
+def instrumented_app():
+    """WSGI factory for gunicorn: the real app plus a per-request SQL statement count."""
+    from sqlalchemy import event
+
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+    local = threading.local()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        local.queries = getattr(local, 'queries', 0) + 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+
+    @app.before_request
+    def reset_count():
+        local.queries = 0
+
+    @app.after_request
+    def report_count(response):
+        response.headers['X-DB-Queries'] = str(getattr(local, 'queries', 0))
+        return response
+
+    return app
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0.0
+
+
+def seed(users, challenges):
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+
+    from app import create_app
+    from extensions import db, dashboard_stats
+    from models import User, Challenge
+
+    app = create_app()
+    with app.app_context():
+        # One hash for everyone; hashing each password would dominate the setup time
+        password_hash = generate_password_hash(PASSWORD)
+        db.session.execute(insert(User.__table__), [{
+            'username': 'benchadmin', 'email': 'benchadmin@example.com', 'password_hash': password_hash,
+            'role': 'admin', 'score': 0
+        }] + [{
+            'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password_hash': password_hash,
+            'role': 'user', 'score': 0
+        } for i in range(users)])
+        db.session.execute(insert(Challenge.__table__), [{
+            'title': f'Bench challenge {i}', 'description': 'Load test', 'category': f'category {i % 6}',
+            'flag': f'AITCTF{{bench_{i}}}', 'points': 10 * (1 + i % 5), 'is_active': True, 'media_files': '[]'
+        } for i in range(challenges)])
+        dashboard_stats.rebuild()
+        db.session.commit()
+        challenge_ids = [challenge_id for challenge_id, in db.session.query(Challenge.id).order_by(Challenge.id)]
+        db.engine.dispose()
+    return challenge_ids
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers, threads, env):
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn',
+        '--workers', str(workers), '--worker-class', 'gthread', '--threads', str(threads),
+        '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+        'bench_event_load:instrumented_app()'
+    ], cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start within 30 seconds')
+
+
+class Player:
+    """One simulated player with its own keep-alive connection and session cookie."""
+
+    def __init__(self, port, number, challenge_ids, correct_ratio, record):
+        self.port = port
+        self.username = f'bench{number}'
+        self.challenge_ids = challenge_ids
+        self.correct_ratio = correct_ratio
+        self.record = record
+        self.cookie = None
+        self.etags = {}
+        self.conn = None
+
+    def request(self, route, method, path, form=None):
+        headers = {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if method == 'GET' and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn = None
+            self.record(route, time.perf_counter() - started, 0, None)
+            return None
+        elapsed = time.perf_counter() - started
+        for name, value in response.getheaders():
+            if name.lower() == 'set-cookie' and value.startswith('session='):
+                self.cookie = value.split(';', 1)[0]
+        if response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+        queries = response.getheader('X-DB-Queries')
+        self.record(route, elapsed, response.status, int(queries) if queries is not None else None)
+        return response
+
+    def login(self):
+        self.cookie = None
+        self.etags.clear()
+        self.request('login', 'POST', '/login', {'username': self.username, 'password': PASSWORD})
+
+    def challenges(self):
+        self.request('challenges', 'GET', '/challenges')
+
+    def submit(self):
+        challenge_id = random.choice(self.challenge_ids)
+        index = challenge_id - self.challenge_ids[0]
+        flag = f'AITCTF{{bench_{index}}}' if random.random() < self.correct_ratio else 'AITCTF{wrong}'
+        self.request('submit', 'POST', f'/challenge/{challenge_id}', {'flag': flag})
+
+    def scoreboard(self):
+        self.request('scoreboard', 'GET', '/scoreboard')
+
+    def run(self, mix, stop):
+        self.login()
+        routes, weights = zip(*mix.items())
+        while not stop.is_set():
+            getattr(self, random.choices(routes, weights)[0])()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        route, _, weight = part.partition('=')
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f'unknown route {route!r}; expected one of {", ".join(ROUTES)}')
+        mix[route] = float(weight)
+    return mix
+
+
+def run_load(port, args, challenge_ids):
+    samples = {route: [] for route in ROUTES}
+    lock = threading.Lock()
+
+    def record(route, elapsed, status, queries):
+        with lock:
+            samples[route].append((elapsed, status, queries))
+
+    stop = threading.Event()
+    players = [Player(port, i % args.users, challenge_ids, args.correct_ratio, record) for i in range(args.clients)]
+    threads = [threading.Thread(target=player.run, args=(args.mix, stop), daemon=True) for player in players]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(30)
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, rows in samples.items():
+        if not rows:
+            continue
+        latencies = [row[0] * 1000 for row in rows]
+        queries = [row[2] for row in rows if row[2] is not None]
+        routes[route] = {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if not row[1] or row[1] >= 500),
+            'throughput_rps': round(len(rows) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'duration_s': round(elapsed, 2),
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'throughput_rps': round(total / elapsed, 1),
+        'routes': routes,
+    }
+
+
+def print_report(result, baseline=None):
+    def change(route, key):
+        if not baseline or route not in baseline.get('routes', {}):
+            return ''
+        before, after = baseline['routes'][route].get(key), result['routes'][route][key]
+        if not before or after is None:
+            return ''
+        return f' ({(after - before) / before:+.0%})'
+
+    print(f'{"route":<11} {"requests":>8} {"errors":>6} {"req/s":>8} {"p50 ms":>14} {"p95 ms":>14} '
+          f'{"p99 ms":>14} {"queries":>7}')
+    for route, stats in result['routes'].items():
+        queries = stats['queries_per_request']
+        print(f'{route:<11} {stats["requests"]:>8} {stats["errors"]:>6} {stats["throughput_rps"]:>8} '
+              f'{str(stats["p50_ms"]) + change(route, "p50_ms"):>14} '
+              f'{str(stats["p95_ms"]) + change(route, "p95_ms"):>14} '
+              f'{str(stats["p99_ms"]) + change(route, "p99_ms"):>14} '
+              f'{queries if queries is not None else "-":>7}')
+    line = f'{result["requests"]} requests in {result["duration_s"]} s, {result["throughput_rps"]} req/s'
+    if baseline:
+        line += f' (baseline {baseline["throughput_rps"]} req/s)'
+    print(line + f', {result["errors"]} errors')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--challenges', type=int, default=30)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('login=5,challenges=40,submit=25,scoreboard=30'))
+    parser.add_argument('--correct-ratio', type=float, default=0.2)
+    parser.add_argument('--json')
+    parser.add_argument('--baseline')
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(db_dir, 'load.db')
+    os.environ.setdefault('SECRET_KEY', 'bench-event-load')
+    challenge_ids = seed(args.users, args.challenges)
+
+    port = free_port()
+    server = start_server(port, args.workers, args.threads, dict(os.environ))
+    try:
+        result = run_load(port, args, challenge_ids)
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['result']
+    print_report(result, baseline)
+
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key not in ('json', 'baseline')}
+        with open(args.json, 'w') as f:
+            json.dump({'settings': settings, 'result': result}, f, indent=2)
+    return 0 if result['requests'] and not result['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
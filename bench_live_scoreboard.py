@@ -0,0 +1,326 @@
+"""How many live scoreboard clients can one gunicorn worker serve?
+
+Starts gunicorn with the shipped gunicorn.conf.py and a single worker
+against a throwaway database, so the worker has GUNICORN_THREADS threads
+and refuses streams past the LIVE_SCOREBOARD_MAX_STREAMS it derives from
+them. For each step, that many clients log in and watch the scoreboard
+the way the page does: each asks for /scoreboard/stream, and when turned
+away with a 503 it polls /scoreboard/live every
+LIVE_SCOREBOARD_FALLBACK_SECONDS instead. A player then solves --events
+challenges while a prober times ordinary page loads.
+
+Each step reports how many clients streamed and how many polled, how long
+each kind took to see a solve, and the page p99 meanwhile. The largest
+step in which every client saw every solve and page p99 stayed under
+--max-page-ms is reported as the worker's capacity.
+
+Usage: python bench_live_scoreboard.py [--steps 10,100,500] [--events 5]
+                                       [--max-page-ms 500] [--json results.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+POINTS = 10
+PASSWORD = 'bench-password'
+
+work_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(work_dir, 'seed.db')
+os.environ.setdefault('MEDIA_FOLDER', os.path.join(work_dir, 'media'))
+os.environ.setdefault('TEMPLATE_CACHE_DIR', os.path.join(work_dir, 'jinja-cache'))
+os.environ.setdefault('MEDIA_DERIVATIVE_WORKERS', '0')
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from extensions import db
+from models import Challenge, User
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0.0
+
+
+def seed(watchers, events):
+    app = create_app()
+    # A cheap hash: the bench measures the scoreboard, not logins
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    with app.app_context():
+        db.session.execute(insert(User.__table__), [
+            {'username': f'watch{i}', 'email': f'watch{i}@example.com', 'password_hash': password_hash,
+             'role': 'admin', 'score': 0}
+            for i in range(watchers)
+        ] + [{'username': 'solver', 'email': 'solver@example.com', 'password_hash': password_hash,
+              'role': 'user', 'score': 0}])
+        db.session.execute(insert(Challenge.__table__), [
+            {'title': f'Bench {i}', 'description': '-', 'category': 'misc', 'flag': f'BENCH{{{i}}}',
+             'points': POINTS, 'is_active': True, 'media_files': '[]', 'crypto_type': '', 'solve_count': 0}
+            for i in range(events)
+        ])
+        db.session.commit()
+        challenge_ids = [challenge.id for challenge in Challenge.query.order_by(Challenge.id)]
+        db.session.remove()
+        db.engine.dispose()  # checkpoints the WAL, so copying seed.db copies everything
+    return challenge_ids
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """One gunicorn master and worker on a copy of the seeded database."""
+
+    def __init__(self, step_dir):
+        self.port = free_port()
+        shutil.copy(os.path.join(work_dir, 'seed.db'), os.path.join(step_dir, 'ctf.db'))
+        env = dict(os.environ,
+                   DATABASE_URL='sqlite:///' + os.path.join(step_dir, 'ctf.db'),
+                   SECRET_KEY='bench', BIND=f'127.0.0.1:{self.port}', WEB_CONCURRENCY='1',
+                   METRICS_MULTIPROCESS_DIR=os.path.join(step_dir, 'metrics'))
+        self.log = open(os.path.join(step_dir, 'gunicorn.log'), 'wb')
+        self.process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+                                        cwd=REPO, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited, see {self.log.name}')
+            try:
+                self.request('GET', '/login')
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f'gunicorn did not start, see {self.log.name}')
+
+    def connection(self, timeout=30):
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=timeout)
+
+    def request(self, method, path, cookie=None, form=None):
+        conn = self.connection()
+        try:
+            headers = {'Cookie': cookie} if cookie else {}
+            body = None
+            if form is not None:
+                body = urlencode(form)
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            return response.status, response.getheader('Set-Cookie'), response.read()
+        finally:
+            conn.close()
+
+    def login(self, username):
+        status, set_cookie, _ = self.request('POST', '/login', form={'username': username, 'password': PASSWORD})
+        if status != 302 or not set_cookie:
+            raise RuntimeError(f'login as {username} failed with {status}')
+        return set_cookie.split(';', 1)[0]
+
+    def stop(self):
+        self.process.send_signal(signal.SIGINT)  # quick shutdown: open streams would hold up a graceful one
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+
+class Watcher(threading.Thread):
+    """A scoreboard page: streams if the worker lets it, polls otherwise."""
+
+    def __init__(self, server, cookie, fallback_seconds, stop):
+        super().__init__(daemon=True)
+        self.server = server
+        self.cookie = cookie
+        self.fallback_seconds = fallback_seconds
+        self.stop = stop
+        self.ready = threading.Event()
+        self.mode = None
+        self.seen = {}  # solver score -> first time it was seen
+        self.conn = None
+
+    def observe(self, score):
+        self.seen.setdefault(score, time.perf_counter())
+
+    def run(self):
+        self.conn = self.server.connection(timeout=None)
+        self.conn.request('GET', '/scoreboard/stream', headers={'Cookie': self.cookie})
+        response = self.conn.getresponse()
+        if response.status == 200:
+            self.mode = 'stream'
+            self.ready.set()
+            self.read_stream(response.fp)
+        else:
+            response.read()
+            self.conn.close()
+            self.mode = 'poll'
+            self.ready.set()
+            while not self.stop.wait(self.fallback_seconds):
+                status, _, body = self.server.request('GET', '/scoreboard/live', cookie=self.cookie)
+                if status == 200:
+                    for entry in json.loads(body)['entries']:
+                        if entry['username'] == 'solver':
+                            self.observe(entry['score'])
+
+    def read_stream(self, fp):
+        # Read the raw socket: chunk-size lines are skipped along with everything else that isn't data
+        event = None
+        try:
+            for line in fp:
+                if line.startswith(b'event: '):
+                    event = line[7:].strip()
+                elif line.startswith(b'data: ') and event in (b'update', b'snapshot'):
+                    data = json.loads(line[6:])
+                    for entry in data['entries'] if event == b'snapshot' else [data]:
+                        if entry['username'] == 'solver':
+                            self.observe(entry['score'])
+        except OSError:
+            pass
+
+    def close(self):
+        if self.mode == 'stream':
+            try:
+                self.conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.conn.close()
+
+
+def run_step(watchers, challenge_ids, fallback_seconds, interval):
+    step_dir = tempfile.mkdtemp(dir=work_dir)
+    server = Server(step_dir)
+    stop = threading.Event()
+    clients = []
+    try:
+        cookies = [server.login(f'watch{i}') for i in range(watchers)]
+        solver = server.login('solver')
+        for cookie in cookies:
+            client = Watcher(server, cookie, fallback_seconds, stop)
+            client.start()
+            client.ready.wait(30)
+            clients.append(client)
+        time.sleep(fallback_seconds)  # let every poller see the starting board
+
+        page_times = []
+        page_errors = 0
+        probing = threading.Event()
+
+        def probe():
+            nonlocal page_errors
+            while not probing.wait(0.2):
+                started = time.perf_counter()
+                try:
+                    status, _, _ = server.request('GET', '/login')
+                except OSError:
+                    status = None
+                if status == 200:
+                    page_times.append((time.perf_counter() - started) * 1000)
+                else:
+                    page_errors += 1
+
+        prober = threading.Thread(target=probe, daemon=True)
+        prober.start()
+        solved_at = {}
+        for i, challenge_id in enumerate(challenge_ids, 1):
+            solved_at[i * POINTS] = time.perf_counter()
+            status, _, _ = server.request('POST', f'/challenge/{challenge_id}', cookie=solver,
+                                          form={'flag': f'BENCH{{{i - 1}}}'})
+            if status != 302:
+                raise RuntimeError(f'solve {i} failed with {status}')
+            time.sleep(interval)
+
+        # Give every poller a chance to see the last solve
+        final = len(challenge_ids) * POINTS
+        deadline = time.time() + 3 * fallback_seconds
+        while time.time() < deadline and not all(final in client.seen for client in clients):
+            time.sleep(0.1)
+        probing.set()
+        prober.join()
+    finally:
+        stop.set()
+        for client in clients:
+            client.close()
+        server.stop()
+
+    latencies = {'stream': [], 'poll': []}
+    delivered = 0
+    for client in clients:
+        for score, sent in solved_at.items():
+            # A poll can skip straight past a score; the first larger one seen delivers it
+            seen = [at for at_score, at in client.seen.items() if at_score >= score]
+            if seen:
+                delivered += 1
+                latencies[client.mode].append((min(seen) - sent) * 1000)
+    streaming = sum(client.mode == 'stream' for client in clients)
+    return {
+        'clients': watchers,
+        'streaming': streaming,
+        'polling': watchers - streaming,
+        'events': len(challenge_ids),
+        'delivery_ratio': delivered / (watchers * len(challenge_ids)),
+        'stream_p50_ms': round(percentile(latencies['stream'], 50), 1),
+        'stream_p99_ms': round(percentile(latencies['stream'], 99), 1),
+        'poll_p50_ms': round(percentile(latencies['poll'], 50), 1),
+        'poll_p99_ms': round(percentile(latencies['poll'], 99), 1),
+        'page_p99_ms': round(percentile(page_times, 99), 1),
+        'page_errors': page_errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', default='10,100,500')
+    parser.add_argument('--events', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between solves')
+    parser.add_argument('--max-page-ms', type=float, default=500.0)
+    parser.add_argument('--json')
+    args = parser.parse_args()
+
+    steps = [int(step) for step in args.steps.split(',')]
+    challenge_ids = seed(max(steps), args.events)
+    fallback_seconds = float(os.environ.get('LIVE_SCOREBOARD_FALLBACK_SECONDS', 5.0))
+
+    results = []
+    capacity = 0
+    print(f'{"clients":>7} {"stream":>6} {"poll":>5} {"delivered":>9} {"stream p50/p99 ms":>18} '
+          f'{"poll p50/p99 ms":>16} {"page p99 ms":>11} {"errors":>6}')
+    try:
+        for watchers in steps:
+            result = run_step(watchers, challenge_ids, fallback_seconds, args.interval)
+            results.append(result)
+            print(f'{result["clients"]:>7} {result["streaming"]:>6} {result["polling"]:>5} '
+                  f'{result["delivery_ratio"]:>9.1%} '
+                  f'{result["stream_p50_ms"]:>8}/{result["stream_p99_ms"]:<9} '
+                  f'{result["poll_p50_ms"]:>7}/{result["poll_p99_ms"]:<8} '
+                  f'{result["page_p99_ms"]:>11} {result["page_errors"]:>6}')
+            if result['delivery_ratio'] < 1 or result['page_errors'] or result['page_p99_ms'] > args.max_page_ms:
+                break
+            capacity = watchers
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f'One worker kept at least {capacity} scoreboard clients live with page p99 under '
+          f'{args.max_page_ms:g} ms (past the stream cap they poll every {fallback_seconds:g} s)')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'max_page_ms': args.max_page_ms, 'capacity': capacity, 'steps': results}, f, indent=2)
+    return 0 if capacity else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
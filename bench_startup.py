@@ -0,0 +1,137 @@
+"""Measure how long a fresh process takes to start serving.
+
+Each run starts a new interpreter, times importing the app, create_app()
+and the first render of a few pages, and reports the median over --runs.
+That covers schema checks, template compilation and the first requests.
+Four scenarios are timed against the same throwaway SQLite database:
+development and production startup (PRODUCTION_STARTUP), each with a cold
+and a warm Jinja bytecode cache.
+
+--json saves the run, --baseline prints the change against a saved run,
+and --max-seconds exits non-zero when the warm production start is slower
+than that, to catch regressions in CI.
+
+Usage: python bench_startup.py [--runs 5] [--json startup.json]
+                               [--baseline before.json] [--max-seconds 1.5]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PAGES = ('/', '/login', '/register')
+PHASES = ('import_s', 'create_app_s', 'first_requests_s', 'total_s')
+SCENARIOS = (
+    ('development, cold cache', '0', False),
+    ('development, warm cache', '0', True),
+    ('production, cold cache', '1', False),
+    ('production, warm cache', '1', True),
+)
+
+
+def child():
+    """Time one start of the app in this process and print the phases as JSON."""
+    started = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    client = app.test_client()
+    for path in PAGES:
+        response = client.get(path)
+        if response.status_code != 200:
+            raise SystemExit(f'GET {path} answered {response.status_code}')
+    served = time.perf_counter()
+    print(json.dumps({
+        'import_s': imported - started,
+        'create_app_s': created - imported,
+        'first_requests_s': served - created,
+        'total_s': served - started,
+    }))
+
+
+def run_child(env):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_scenarios(runs):
+    work_dir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(work_dir, 'startup.db'),
+        'SECRET_KEY': env.get('SECRET_KEY', 'bench-startup'),
+        'MEDIA_DERIVATIVE_WORKERS': '0',
+    })
+    # Create the schema once so every scenario starts against an existing database
+    run_child(dict(env, PRODUCTION_STARTUP='0', TEMPLATE_CACHE_DIR=os.path.join(work_dir, 'setup-cache')))
+
+    results = {}
+    try:
+        for name, production, warm in SCENARIOS:
+            cache_dir = os.path.join(work_dir, f'cache-{production}')
+            samples = []
+            for _ in range(runs):
+                if not warm:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                samples.append(run_child(dict(env, PRODUCTION_STARTUP=production, TEMPLATE_CACHE_DIR=cache_dir)))
+            results[name] = {
+                phase: round(statistics.median(sample[phase] for sample in samples) * 1000, 1)
+                for phase in PHASES
+            }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def print_report(results, baseline=None):
+    def cell(name, phase):
+        value = results[name][phase]
+        before = (baseline or {}).get(name, {}).get(phase)
+        return f'{value}' + (f' ({(value - before) / before:+.0%})' if before else '')
+
+    print(f'{"scenario (median ms)":<24} {"import":>14} {"create_app":>14} {"first pages":>14} {"total":>14}')
+    for name in results:
+        print(f'{name:<24} ' + ' '.join(f'{cell(name, phase):>14}' for phase in PHASES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--max-seconds', type=float, help='Fail if a warm production start takes longer.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return 0
+
+    results = run_scenarios(args.runs)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['result']
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'settings': {'runs': args.runs, 'pages': PAGES}, 'result': results}, f, indent=2)
+    warm_production = results['production, warm cache']['total_s'] / 1000
+    if args.max_seconds is not None and warm_production > args.max_seconds:
+        print(f'Warm production start took {warm_production:.3f}s, over the {args.max_seconds}s limit')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import update
+
+from scoring import challenge_value
+
+# value is what a solve is worth now; it differs from points for dynamic challenges
+CatalogEntry = namedtuple('CatalogEntry', ['id', 'title', 'category', 'points', 'value', 'is_active'])
+CategoryProgress = namedtuple('CategoryProgress', ['category', 'solved', 'total'])
+
+
+class ChallengeCatalog:
+    """Per-process cache of the challenge list, keyed by a shared version.
+
+    The version lives in the cache_version table so that every worker sees
+    it. Admin routes call bump() inside the transaction that changes a
+    challenge, as does a solve that changes a dynamic challenge's value;
+    other workers notice within CATALOG_VERSION_CHECK_SECONDS and reload
+    the list on their next read.
+    """
+
+    NAME = 'catalog'
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._version = None
+        self._updated_at = None
+        self._checked_at = 0
+        self._entries = None
+        self._entries_version = None
+        self.check_interval = 1.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('CATALOG_VERSION_CHECK_SECONDS', 1.0)
+        app.extensions['catalog'] = self
+
+    def version(self):
+        """Return (version, updated_at) of the catalog, re-read at most once per check interval."""
+        from extensions import db
+        from models import CacheVersion
+
+        if self._version is None or time.monotonic() - self._checked_at > self.check_interval:
+            row = db.session.query(CacheVersion.version, CacheVersion.updated_at).filter_by(name=self.NAME).first()
+            with self._lock:
+                self._version, self._updated_at = row if row else (0, datetime.utcnow())
+                self._checked_at = time.monotonic()
+        return self._version, self._updated_at
+
+    def all(self):
+        from extensions import db
+        from models import Challenge
+
+        version, _ = self.version()
+        entries = self._entries
+        if entries is None or self._entries_version != version:
+            rows = db.session.query(
+                Challenge.id, Challenge.title, Challenge.category, Challenge.points, Challenge.is_active,
+                Challenge.minimum_points, Challenge.decay, Challenge.solve_count
+            ).order_by(Challenge.id).all()
+            entries = [
+                CatalogEntry(row.id, row.title, row.category, row.points,
+                             challenge_value(row.points, row.minimum_points, row.decay, row.solve_count or 0),
+                             row.is_active)
+                for row in rows
+            ]
+            with self._lock:
+                self._entries, self._entries_version = entries, version
+        return entries
+
+    def active(self):
+        return [entry for entry in self.all() if entry.is_active]
+
+    def progress(self, solved):
+        """Solved and total active challenges per category, in catalog order, for a set of solved ids."""
+        categories = {}
+        for entry in self.active():
+            done, total = categories.get(entry.category, (0, 0))
+            categories[entry.category] = (done + (entry.id in solved), total + 1)
+        return [CategoryProgress(category, done, total) for category, (done, total) in categories.items()]
+
+    def bump(self):
+        """Invalidate the catalog everywhere; commits with the caller's transaction."""
+        from extensions import db
+        from models import CacheVersion
+
+        db.session.execute(
+            update(CacheVersion.__table__)
+            .where(CacheVersion.name == self.NAME)
+            .values(version=CacheVersion.version + 1, updated_at=datetime.utcnow())
+        )
+        with self._lock:
+            self._version = None
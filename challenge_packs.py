@@ -0,0 +1,205 @@
+"""Challenge packs: a zip of manifest.jsonl plus the media it refers to.
+
+Each manifest line is one challenge:
+
+    {"title": ..., "description": ..., "category": ..., "flag": ...,
+     "points": 10, "minimum_points": null, "decay": null,
+     "crypto_type": "", "is_active": true,
+     "media": [{"name": "photo.png", "file": "media/<sha256>.png"}]}
+
+where "file" is the member holding the attachment. Import is keyed on
+title, so loading the same pack twice updates challenges in place instead
+of duplicating them. Export writes the same format from a live instance.
+"""
+import json
+import os
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, update
+from werkzeug.utils import secure_filename
+
+import scoring
+from routes import ALLOWED_EXTENSIONS, allowed_file
+
+MANIFEST = 'manifest.jsonl'
+FIELDS = ('title', 'description', 'category', 'flag', 'points', 'minimum_points', 'decay', 'crypto_type', 'is_active')
+
+ImportResult = namedtuple('ImportResult', ['created', 'updated', 'media', 'rejected'])
+
+
+class PackError(Exception):
+    pass
+
+
+def _validate(record):
+    if not isinstance(record, dict):
+        return None, 'not a JSON object'
+    values = {
+        'title': str(record.get('title') or '').strip(),
+        'description': str(record.get('description') or '').strip(),
+        'category': str(record.get('category') or '').strip(),
+        'flag': str(record.get('flag') or '').strip(),
+        'crypto_type': str(record.get('crypto_type') or ''),
+        'is_active': bool(record.get('is_active', True)),
+    }
+    if not all([values['title'], values['description'], values['category'], values['flag']]):
+        return None, 'title, description, category and flag are required'
+    try:
+        values['points'] = int(record.get('points', 0))
+    except (TypeError, ValueError):
+        return None, 'points must be a number'
+    if values['points'] < 0:
+        return None, 'points must be positive'
+    try:
+        values['minimum_points'], values['decay'] = (
+            None if record.get(field) is None else int(record[field]) for field in ('minimum_points', 'decay')
+        )
+    except (TypeError, ValueError):
+        return None, 'minimum_points and decay must be numbers'
+    if (values['minimum_points'] is None) != (values['decay'] is None):
+        return None, 'dynamic scoring needs both minimum_points and decay'
+    if values['decay'] is not None and not (0 <= values['minimum_points'] <= values['points'] and values['decay'] >= 1):
+        return None, 'minimum_points must be between 0 and points, and decay at least 1'
+    media = record.get('media') or []
+    if not isinstance(media, list) or not all(isinstance(m, dict) and m.get('file') for m in media):
+        return None, 'media must be a list of {"name", "file"} objects'
+    # The stored extension comes from the name, so it is checked like an upload's filename
+    media = [{'file': m['file'], 'name': secure_filename(str(m.get('name') or os.path.basename(m['file'])))}
+             for m in media]
+    for m in media:
+        if not allowed_file(m['name']):
+            return None, f'media {m["file"]} needs a name ending in one of: {", ".join(sorted(ALLOWED_EXTENSIONS))}'
+    return (values, media), None
+
+
+def _copy_media(pack, member, name):
+    """Store one attachment from the pack; runs on the copy pool."""
+    from extensions import media_store
+
+    with pack.open(member) as stream:
+        return media_store.save_stream(stream, name)
+
+
+def import_pack(path, workers=4, dry_run=False):
+    """Upsert every challenge in a pack in one transaction. Returns an ImportResult.
+
+    The manifest is read line by line. Each line's attachments are handed
+    to a thread pool as soon as it is read, so media is hashed and copied
+    into the media store while the rest of the manifest is parsed.
+    """
+    from extensions import db, catalog, dashboard_stats
+    from models import Challenge
+
+    existing = {challenge.title: challenge for challenge in db.session.query(
+        Challenge.title, Challenge.id, Challenge.points, Challenge.minimum_points, Challenge.decay, Challenge.solve_count
+    )}
+    rows, rejected, seen = [], [], set()
+    with zipfile.ZipFile(path) as pack, ThreadPoolExecutor(workers) as pool:
+        try:
+            manifest = pack.open(MANIFEST)
+        except KeyError:
+            raise PackError(f'{path} has no {MANIFEST}')
+        members = set(pack.namelist())
+        with manifest:
+            for line, raw in enumerate(manifest, 1):
+                if not raw.strip():
+                    continue
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    record = None
+                parsed, reason = _validate(record)
+                if parsed is None:
+                    rejected.append((line, reason))
+                    continue
+                values, media = parsed
+                missing = [m['file'] for m in media if m['file'] not in members]
+                if missing:
+                    rejected.append((line, f'{missing[0]} is not in the pack'))
+                    continue
+                if values['title'] in seen:
+                    rejected.append((line, f'duplicate title {values["title"]!r}'))
+                    continue
+                seen.add(values['title'])
+                futures = [] if dry_run else [
+                    pool.submit(_copy_media, pack, m['file'], m['name'])
+                    for m in media
+                ]
+                rows.append((values, futures))
+        # Waiting on every copy also surfaces the first failure before anything is written
+        for values, futures in rows:
+            values['media_files'] = json.dumps([future.result() for future in futures])
+
+    inserts = [values for values, _ in rows if values['title'] not in existing]
+    updates = [dict(values, _id=existing[values['title']].id) for values, _ in rows if values['title'] in existing]
+    media_count = sum(len(futures) for _, futures in rows)
+    if dry_run:
+        return ImportResult(len(inserts), len(updates), media_count, rejected)
+
+    challenge = Challenge.__table__
+    try:
+        if inserts:
+            now = datetime.utcnow()
+            # One statement per row, so each id comes from the insert itself
+            new_ids = [
+                db.session.execute(insert(challenge).values(created_at=now, **values)).inserted_primary_key[0]
+                for values in inserts
+            ]
+            dashboard_stats.challenges_added(new_ids)
+        if updates:
+            db.session.execute(
+                update(challenge).where(challenge.c.id == bindparam('_id')).values(
+                    **{field: bindparam(field) for field in FIELDS + ('media_files',)}
+                ),
+                updates
+            )
+            for values in updates:
+                # Solvers of an updated challenge hold its new value
+                old = existing[values['title']]
+                scoring.revalue(
+                    old.id,
+                    scoring.challenge_value(old.points, old.minimum_points, old.decay, old.solve_count),
+                    scoring.challenge_value(values['points'], values['minimum_points'], values['decay'], old.solve_count)
+                )
+        catalog.bump()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ImportResult(len(inserts), len(updates), media_count, rejected)
+
+
+def export_pack(path):
+    """Write every challenge and its media to a pack. Returns (challenges, media files)."""
+    from extensions import db, media_store
+    from models import Challenge
+
+    count, written = 0, set()
+    temp_path = f'{path}.tmp'
+    try:
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as pack:
+            info = zipfile.ZipInfo(MANIFEST, datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with pack.open(info, 'w') as manifest:
+                for challenge in db.session.query(Challenge).order_by(Challenge.id).yield_per(100):
+                    record = {field: getattr(challenge, field) for field in FIELDS}
+                    record['media'] = [
+                        {'name': reference['name'], 'file': f'media/{reference["file"]}'}
+                        for reference in challenge.get_media()
+                    ]
+                    written.update(reference['file'] for reference in challenge.get_media())
+                    manifest.write((json.dumps(record) + '\n').encode('utf-8'))
+                    count += 1
+            for stored_name in sorted(written):
+                if not os.path.exists(media_store.path(stored_name)):
+                    raise PackError(f'Stored media {stored_name} is missing')
+                # Images and archives are already compressed
+                pack.write(media_store.path(stored_name), f'media/{stored_name}', compress_type=zipfile.ZIP_STORED)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+    return count, len(written)
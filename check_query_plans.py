@@ -0,0 +1,129 @@
+"""Fail if any route's SQL falls back to a full table scan.
+
+Builds a throwaway SQLite database, exercises every route as an admin and as
+a player, records each statement the app runs and checks its
+EXPLAIN QUERY PLAN. Statements that read a whole table by design are listed
+in INTENTIONAL_SCANS.
+
+Usage: python check_query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(db_dir, 'plans.db')
+os.environ['SUBMISSION_WRITE_BEHIND'] = '0'
+
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import Challenge
+
+# (table, statement pattern) pairs for queries that are meant to read every row
+INTENTIONAL_SCANS = [
+    ('user', r'WHERE user\.role != '),  # leaderboard reload
+    ('challenge', r'^SELECT .* FROM challenge$'),  # challenge ids collected by this script
+    ('challenge', r'FROM challenge LEFT OUTER JOIN challenge_stats '),  # admin dashboard, one row per challenge
+    ('stat_counter', r'^SELECT .* FROM stat_counter$'),  # dashboard totals, one row per counter
+    ('challenge', r'^SELECT .* FROM challenge ORDER BY challenge\.id$'),  # catalog reload
+    ('score_event', r'FROM score_event ORDER BY score_event\.id DESC LIMIT'),  # newest event, stops after one row
+]
+
+SCAN = re.compile(r'^SCAN (\w+)\b(?! USING (COVERING )?INDEX)')
+
+
+def collect_statements(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def exercise_routes(app):
+    admin = app.test_client()
+    admin.post('/register', data={'username': 'admin', 'email': 'admin@example.com', 'password': 'password123'})
+    admin.post('/login', data={'username': 'admin', 'password': 'password123'})
+    for i in range(3):
+        admin.post('/admin/challenge/add', data={
+            'title': f'Challenge {i}', 'description': 'Plan check', 'category': 'misc',
+            'flag': f'AITCTF{{plan_{i}}}', 'points': 10,
+            **({'minimum_points': 5, 'decay': 3} if i == 1 else {})  # one dynamic challenge
+        })
+    with app.app_context():
+        challenge_ids = [c.id for c in Challenge.query.all()]
+
+    player = app.test_client()
+    player.post('/register', data={'username': 'player', 'email': 'player@example.com', 'password': 'password123'})
+    player.post('/login', data={'username': 'Player', 'password': 'password123'})
+    # A second player's solve decays the dynamic challenge
+    rival = app.test_client()
+    rival.post('/register', data={'username': 'rival', 'email': 'rival@example.com', 'password': 'password123'})
+    rival.post('/login', data={'username': 'rival', 'password': 'password123'})
+    for client in (admin, player, rival):
+        client.get('/')
+        client.get('/challenges')
+        client.get('/scoreboard')
+        for challenge_id in challenge_ids:
+            client.get(f'/challenge/{challenge_id}')
+            client.post(f'/challenge/{challenge_id}', data={'flag': 'AITCTF{wrong}'})
+            client.post(f'/challenge/{challenge_id}', data={'flag': f'AITCTF{{plan_{challenge_id - 1}}}'})
+    for client in (admin, player):
+        client.get('/scoreboard/timeline')
+        for path in ('/api/v1/challenges', '/api/v1/progress', '/api/v1/scoreboard?limit=1'):
+            client.get(path)
+        client.post('/api/v1/submissions', json={'flags': [
+            {'challenge_id': challenge_id, 'flag': 'AITCTF{wrong}'} for challenge_id in challenge_ids
+        ]})
+    admin.get('/api/v1/scoreboard?limit=1&cursor=0:1')
+    admin.get('/admin')
+    admin.get('/admin/submissions.csv').get_data()  # the export streams, so read it through
+    admin.get(f'/admin/challenge/edit/{challenge_ids[0]}')
+    admin.post(f'/admin/challenge/edit/{challenge_ids[0]}', data={
+        'title': 'Edited', 'description': 'Plan check', 'category': 'misc', 'flag': 'AITCTF{plan_0}', 'points': 20
+    })
+    admin.post(f'/admin/challenge/delete/{challenge_ids[-1]}')
+    player.get('/logout')
+
+
+def full_scans(app, statements):
+    problems = []
+    seen = set()
+    with app.app_context():
+        for statement, parameters in statements:
+            statement = ' '.join(statement.split())
+            if statement in seen:
+                continue
+            seen.add(statement)
+            plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            for row in plan:
+                match = SCAN.match(row[-1])
+                if not match:
+                    continue
+                table = match.group(1)
+                if any(t == table and re.search(p, statement) for t, p in INTENTIONAL_SCANS):
+                    continue
+                problems.append((table, statement, row[-1]))
+    return problems
+
+
+def main():
+    app = create_app()
+    statements = collect_statements(app)
+    exercise_routes(app)
+    problems = full_scans(app, statements)
+    print(f'Checked {len(set(s for s, _ in statements))} distinct statements')
+    for table, statement, detail in problems:
+        print(f'FULL SCAN of {table}: {detail}\n    {statement}')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
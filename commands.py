@@ -0,0 +1,232 @@
+import os
+import zipfile
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+
+import challenge_packs
+import retention
+import scoring
+import user_import
+from extensions import db, media_store, derivatives, dashboard_stats, score_timeline
+from migrations import current_version, latest_version, upgrade
+from models import Challenge, User
+
+
+def init_commands(app):
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Apply pending schema migrations."""
+        applied = upgrade()
+        for version in applied:
+            click.echo(f'Applied migration {version}')
+        click.echo(f'Schema version {current_version()} (latest {latest_version()})')
+
+    @app.cli.group()
+    def stats():
+        """Manage the admin dashboard counters."""
+
+    @stats.command('rebuild')
+    def stats_rebuild():
+        """Recompute the dashboard counters from the users, challenges and submissions tables."""
+        totals = dashboard_stats.rebuild()
+        db.session.commit()
+        click.echo(', '.join(f'{value} {name}' for name, value in totals.items()))
+
+    @app.cli.group()
+    def scores():
+        """Audit player scores."""
+
+    @scores.command('rebuild')
+    @click.option('--dry-run', is_flag=True, help='Report wrong scores without fixing them.')
+    def scores_rebuild(dry_run):
+        """Recompute solve counts and every score from the submissions table."""
+        changes, miscounted = scoring.rebuild(dry_run)
+        for change in changes:
+            click.echo(f'{change.username}: {change.old} -> {change.new}')
+        verb = 'Would fix' if dry_run else 'Fixed'
+        click.echo(f'{verb} {len(changes)} scores and {miscounted} challenge solve counts')
+
+    @scores.command('rebuild-timeline')
+    def scores_rebuild_timeline():
+        """Replace the scoreboard chart history with a replay of the submissions table."""
+        events = score_timeline.rebuild()
+        db.session.commit()
+        click.echo(f'Recorded {events} score events')
+
+    @app.cli.group()
+    def submissions():
+        """Manage the submission log."""
+
+    @submissions.command('compact')
+    @click.option('--older-than-hours', type=int, help='Defaults to SUBMISSION_RETENTION_HOURS.')
+    @click.option('--archive-dir', type=click.Path(file_okay=False), help='Defaults to SUBMISSION_ARCHIVE_DIR.')
+    @click.option('--batch-size', default=5000, show_default=True, help='Rows archived per transaction.')
+    @click.option('--dry-run', is_flag=True, help='Count what would be compacted without changing anything.')
+    def submissions_compact(older_than_hours, archive_dir, batch_size, dry_run):
+        """Archive old incorrect submissions and fold them into hourly rollups."""
+        hours = older_than_hours if older_than_hours is not None else current_app.config['SUBMISSION_RETENTION_HOURS']
+        archive_dir = archive_dir or current_app.config.get('SUBMISSION_ARCHIVE_DIR') \
+            or os.path.join(current_app.instance_path, 'submission-archive')
+        cutoff = datetime.utcnow() - timedelta(hours=hours)
+        if dry_run:
+            result = retention.compact(cutoff, archive_dir, batch_size, dry_run=True)
+            click.echo(f'Would archive {result.rows} incorrect submissions into {result.rollups} rollups')
+            return
+        with click.progressbar(length=0, label='Compacting submissions', show_pos=True) as bar:
+            result = retention.compact(cutoff, archive_dir, batch_size, progress=bar.update)
+        if result.archive:
+            click.echo(f'Archived {result.rows} incorrect submissions to {result.archive} '
+                       f'and updated {result.rollups} rollups')
+        else:
+            click.echo(f'No incorrect submissions older than {hours} hours')
+
+    @app.cli.group()
+    def users():
+        """Manage player accounts."""
+
+    @users.command('import')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+    @click.option('--batch-size', default=1000, show_default=True, help='Users inserted per transaction.')
+    @click.option('--workers', type=int, help='Hashing processes; defaults to the number of CPUs.')
+    @click.option('--dry-run', is_flag=True, help='Validate and check for duplicates without creating anyone.')
+    def users_import(path, format, batch_size, workers, dry_run):
+        """Create accounts from a CSV or JSONL file of username, email, password[, role]."""
+        existing = db.session.query(func.lower(User.username), func.lower(User.email)).all()
+        accepted, rejected = user_import.plan(
+            user_import.read_records(path, format), {u for u, _ in existing}, {e for _, e in existing}
+        )
+        db.session.close()
+        for line, reason in rejected:
+            click.echo(f'{path}:{line}: skipped, {reason}', err=True)
+        if dry_run or not accepted:
+            click.echo(f'{len(accepted)} users to import, {len(rejected)} skipped')
+            return
+
+        def insert_batch(batch):
+            created_at = datetime.utcnow()
+            rows = [{'username': row.username, 'email': row.email, 'password_hash': password_hash,
+                     'role': row.role, 'score': 0, 'created_at': created_at} for row, password_hash in batch]
+            try:
+                db.session.execute(insert(User.__table__), rows)
+                dashboard_stats.user_registered(len(rows))
+                db.session.commit()
+                return len(rows)
+            except IntegrityError:
+                # Someone registered one of these names meanwhile; insert the rest one at a time
+                db.session.rollback()
+            inserted = 0
+            for (row, _), values in zip(batch, rows):
+                try:
+                    db.session.execute(insert(User.__table__).values(**values))
+                    dashboard_stats.user_registered()
+                    db.session.commit()
+                    inserted += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    click.echo(f'{path}:{row.line}: skipped, {row.username} registered during the import', err=True)
+            return inserted
+
+        imported, batch = 0, []
+        hashed = user_import.hash_passwords(accepted, workers)
+        with click.progressbar(hashed, length=len(accepted), label='Importing users') as progress:
+            for item in progress:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    imported += insert_batch(batch)
+                    batch = []
+            if batch:
+                imported += insert_batch(batch)
+        click.echo(f'Imported {imported} users, {len(rejected) + len(accepted) - imported} skipped')
+
+    @app.cli.group()
+    def challenges():
+        """Import and export challenge packs."""
+
+    @challenges.command('import')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--workers', default=4, show_default=True, help='Threads copying media into the store.')
+    @click.option('--dry-run', is_flag=True, help='Check the pack without changing anything.')
+    def challenges_import(path, workers, dry_run):
+        """Create or update (by title) every challenge in a pack."""
+        try:
+            result = challenge_packs.import_pack(path, workers, dry_run)
+        except (challenge_packs.PackError, zipfile.BadZipFile) as e:
+            raise click.ClickException(str(e))
+        for line, reason in result.rejected:
+            click.echo(f'{challenge_packs.MANIFEST}:{line}: skipped, {reason}', err=True)
+        summary = f'{result.created} and {{}} {result.updated} challenges with {result.media} media files'
+        if dry_run:
+            click.echo('Would create ' + summary.format('update') + f', {len(result.rejected)} skipped')
+            return
+        click.echo('Created ' + summary.format('updated') + f', {len(result.rejected)} skipped')
+        if derivatives.enabled:
+            # Only images without derivatives yet are built
+            built = [derivatives.submit(media) for challenge in Challenge.query.all() for media in challenge.get_media()]
+            for future in filter(None, built):
+                future.result()
+            derivatives.shutdown()
+
+    @challenges.command('export')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    def challenges_export(path):
+        """Write every challenge and its media to a pack."""
+        try:
+            count, media = challenge_packs.export_pack(path)
+        except challenge_packs.PackError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Exported {count} challenges and {media} media files to {path}')
+
+    @app.cli.group()
+    def media():
+        """Manage stored challenge media."""
+
+    @media.command('adopt')
+    def media_adopt():
+        """Move uploads stored under their original names into content-addressed storage."""
+        adopted = {}
+        for challenge in Challenge.query.all():
+            references = challenge.get_media_files()
+            for i, reference in enumerate(references):
+                if isinstance(reference, dict):
+                    continue
+                if reference not in adopted:
+                    if not os.path.exists(media_store.path(reference)):
+                        click.echo(f'Missing file {reference} for challenge {challenge.id}', err=True)
+                        continue
+                    adopted[reference] = media_store.adopt(reference)
+                references[i] = adopted[reference]
+            challenge.set_media_files(references)
+        db.session.commit()
+
+        for legacy_name, reference in adopted.items():
+            if reference['file'] != legacy_name:
+                os.remove(media_store.path(legacy_name))
+        click.echo(f'Adopted {len(adopted)} files into {len(set(r["file"] for r in adopted.values()))} stored objects')
+
+    @media.command('gc')
+    def media_gc():
+        """Delete stored media that no challenge refers to."""
+        references = [media for challenge in Challenge.query.all() for media in challenge.get_media()]
+        removed = media_store.remove_unreferenced({media['file'] for media in references})
+        removed += derivatives.remove_unreferenced({media['sha256'] for media in references if media['sha256']})
+        click.echo(f'Removed {len(removed)} unreferenced files')
+
+    @media.command('derivatives')
+    def media_derivatives():
+        """Build missing thumbnails and web-sized variants for every stored image."""
+        if not derivatives.enabled:
+            raise click.ClickException('Pillow is not installed or MEDIA_DERIVATIVE_WORKERS is 0')
+        pending = {}
+        for challenge in Challenge.query.all():
+            for media in challenge.get_media():
+                if derivatives.supports(media):
+                    pending.setdefault(media['sha256'], media)
+        futures = [derivatives.submit(media) for media in pending.values()]
+        built = sum(len(future.result()) for future in futures)
+        derivatives.shutdown()
+        click.echo(f'Built {built} derivatives for {len(pending)} images')
@@ -4,3 +4,74 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///ctf.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Startup (see startup.py)
+    PRODUCTION_STARTUP = os.environ.get('PRODUCTION_STARTUP', '0') == '1'  # trust schema_version, precompile templates
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')  # Jinja bytecode cache; default instance/jinja-cache
+
+    # Database engine (see storage.py)
+    SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '1') == '1'  # 0 leaves SQLite connections as the driver opens them
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable enough with WAL
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))  # per connection
+    SQLITE_SERIALIZE_WRITES = os.environ.get('SQLITE_SERIALIZE_WRITES', '1') == '1'  # one writer per process
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 0)) or None  # None: SQLAlchemy's default
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))  # seconds, for server databases
+
+    # Scoreboard
+    SCOREBOARD_PAGE_SIZE = int(os.environ.get('SCOREBOARD_PAGE_SIZE', 50))
+    SCOREBOARD_AROUND_ME = int(os.environ.get('SCOREBOARD_AROUND_ME', 0))  # neighbours shown to players
+    LEADERBOARD_RESYNC_SECONDS = int(os.environ.get('LEADERBOARD_RESYNC_SECONDS', 60))
+    LIVE_SCOREBOARD_POLL_SECONDS = float(os.environ.get('LIVE_SCOREBOARD_POLL_SECONDS', 2.0))  # cross-worker solves
+    LIVE_SCOREBOARD_HEARTBEAT_SECONDS = 15.0
+    LIVE_SCOREBOARD_BACKLOG = 1000  # deltas kept for reconnecting clients
+    LIVE_SCOREBOARD_QUEUE_SIZE = 256  # per subscriber before it is resynced
+    LIVE_SCOREBOARD_MAX_STREAMS = int(os.environ.get('LIVE_SCOREBOARD_MAX_STREAMS', 4))  # per worker, 0 for no cap
+    LIVE_SCOREBOARD_STREAM_SECONDS = float(os.environ.get('LIVE_SCOREBOARD_STREAM_SECONDS', 300))  # then reconnect
+    LIVE_SCOREBOARD_FALLBACK_SECONDS = float(os.environ.get('LIVE_SCOREBOARD_FALLBACK_SECONDS', 5.0))  # polling past the cap
+    SCORE_TIMELINE_USERS = int(os.environ.get('SCORE_TIMELINE_USERS', 20))  # leaders on the admin chart
+    SCORE_TIMELINE_BUCKET_SECONDS = int(os.environ.get('SCORE_TIMELINE_BUCKET_SECONDS', 300))  # default resolution
+
+    # JSON API
+    API_BATCH_SIZE = int(os.environ.get('API_BATCH_SIZE', 20))  # flags per POST /api/v1/submissions
+    API_SCOREBOARD_MAX_LIMIT = int(os.environ.get('API_SCOREBOARD_MAX_LIMIT', 200))
+
+    # Challenge catalog
+    CATALOG_VERSION_CHECK_SECONDS = float(os.environ.get('CATALOG_VERSION_CHECK_SECONDS', 1.0))
+
+    # Challenge media
+    MEDIA_FOLDER = os.environ.get('MEDIA_FOLDER', 'static/uploads/challenges')  # relative to the app, or absolute
+    MEDIA_TEMP_FOLDER = os.environ.get('MEDIA_TEMP_FOLDER')  # uploads in progress; defaults to instance/media-tmp
+    MAX_MEDIA_FILE_SIZE = int(os.environ.get('MAX_MEDIA_FILE_SIZE', 50 * 1024 * 1024))
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 200 * 1024 * 1024))  # whole request
+    MEDIA_MAX_AGE = 365 * 24 * 3600  # for content-addressed URLs
+    MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX')  # nginx internal location
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '0') == '1'
+    MEDIA_DERIVATIVE_WORKERS = int(os.environ.get('MEDIA_DERIVATIVE_WORKERS', 2))  # 0 disables thumbnails
+
+    # Flag submission
+    SUBMISSION_WRITE_BEHIND = os.environ.get('SUBMISSION_WRITE_BEHIND', '1') == '1'  # queue incorrect attempts
+    SUBMISSION_QUEUE_SIZE = int(os.environ.get('SUBMISSION_QUEUE_SIZE', 10000))
+    SUBMISSION_FLUSH_SIZE = int(os.environ.get('SUBMISSION_FLUSH_SIZE', 500))
+    SUBMISSION_FLUSH_INTERVAL = float(os.environ.get('SUBMISSION_FLUSH_INTERVAL', 0.5))
+    SOLVED_CACHE_SECONDS = float(os.environ.get('SOLVED_CACHE_SECONDS', 5.0))  # solved sets seen by other workers
+    SUBMISSION_RETENTION_HOURS = int(os.environ.get('SUBMISSION_RETENTION_HOURS', 24))  # incorrect attempts kept raw
+    SUBMISSION_ARCHIVE_DIR = os.environ.get('SUBMISSION_ARCHIVE_DIR')  # defaults to instance/submission-archive
+
+    # Authentication
+    IDENTITY_CACHE_SECONDS = float(os.environ.get('IDENTITY_CACHE_SECONDS', 5.0))  # 0 disables the user cache
+    IDENTITY_CACHE_SIZE = 10000
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 0 hashes on the request thread
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))  # waiting logins before answering 503
+    PASSWORD_HASH_TIMEOUT = 10.0
+
+    # Instrumentation
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR')  # sum every worker's metrics per scrape
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 1.0))  # how often workers save them there
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token for scrapers; admins can always read /metrics
+    SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))  # 0 disables the slow request log
+    SLOW_REQUEST_MAX_QUERIES = 50  # statements logged per slow request
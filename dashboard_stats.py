@@ -0,0 +1,192 @@
+from collections import namedtuple
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from scoring import challenge_value
+
+# Running totals kept in the stat_counter table
+USERS = 'users'
+CHALLENGES = 'challenges'
+SUBMISSIONS = 'submissions'
+SOLVES = 'solves'
+COUNTERS = (USERS, CHALLENGES, SUBMISSIONS, SOLVES)
+
+ChallengeSummary = namedtuple('ChallengeSummary', [
+    'id', 'title', 'category', 'points', 'value', 'is_active', 'solves', 'attempts', 'first_blood_user', 'first_blood_at'
+])
+
+
+class DashboardStats:
+    """Materialized counters behind the admin dashboard.
+
+    Totals live in stat_counter and per-challenge solves, attempts and first
+    blood in challenge_stats. Every write path records its change with one of
+    the methods below on the session it is about to commit, so the counters
+    move in the same transaction as the rows they count and the dashboard
+    never has to scan the submission table. rebuild() recomputes everything
+    from scratch after bulk changes that bypass those paths.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['dashboard_stats'] = self
+
+    @staticmethod
+    def _session(conn):
+        from extensions import db
+
+        return conn if conn is not None else db.session
+
+    def _add(self, conn, name, amount):
+        from models import StatCounter
+
+        if amount:
+            self._session(conn).execute(
+                update(StatCounter.__table__).where(StatCounter.name == name).values(value=StatCounter.value + amount)
+            )
+
+    def user_registered(self, count=1, conn=None):
+        self._add(conn, USERS, count)
+
+    def challenge_added(self, challenge_id, conn=None):
+        self.challenges_added([challenge_id], conn)
+
+    def challenges_added(self, challenge_ids, conn=None):
+        from models import ChallengeStats
+
+        if challenge_ids:
+            self._session(conn).execute(insert(ChallengeStats.__table__), [
+                {'challenge_id': challenge_id, 'solves': 0, 'attempts': 0} for challenge_id in challenge_ids
+            ])
+        self._add(conn, CHALLENGES, len(challenge_ids))
+
+    def challenge_deleted(self, challenge_id, conn=None):
+        """Drop a challenge and the submissions counted against it; call before deleting them."""
+        from models import ChallengeStats
+
+        session = self._session(conn)
+        row = session.execute(
+            select(ChallengeStats.solves, ChallengeStats.attempts).where(ChallengeStats.challenge_id == challenge_id)
+        ).first()
+        session.execute(delete(ChallengeStats.__table__).where(ChallengeStats.challenge_id == challenge_id))
+        self._add(conn, CHALLENGES, -1)
+        if row is not None:
+            self._add(conn, SUBMISSIONS, -row.attempts)
+            self._add(conn, SOLVES, -row.solves)
+
+    def attempts_recorded(self, counts, conn=None):
+        """Count incorrect attempts, given as {challenge_id: number of attempts}."""
+        from models import ChallengeStats
+
+        session = self._session(conn)
+        for challenge_id, count in counts.items():
+            session.execute(
+                update(ChallengeStats.__table__)
+                .where(ChallengeStats.challenge_id == challenge_id)
+                .values(attempts=ChallengeStats.attempts + count)
+            )
+        self._add(conn, SUBMISSIONS, sum(counts.values()))
+
+    def solve_recorded(self, challenge_id, user_id, solved_at, conn=None):
+        from models import ChallengeStats
+
+        session = self._session(conn)
+        session.execute(
+            update(ChallengeStats.__table__)
+            .where(ChallengeStats.challenge_id == challenge_id)
+            .values(solves=ChallengeStats.solves + 1, attempts=ChallengeStats.attempts + 1)
+        )
+        # Only the first committed solve finds first_blood_user_id still empty
+        session.execute(
+            update(ChallengeStats.__table__)
+            .where(ChallengeStats.challenge_id == challenge_id, ChallengeStats.first_blood_user_id.is_(None))
+            .values(first_blood_user_id=user_id, first_blood_at=solved_at)
+        )
+        self._add(conn, SUBMISSIONS, 1)
+        self._add(conn, SOLVES, 1)
+
+    def rebuild(self, conn=None):
+        """Recompute every counter from the base tables."""
+        from models import User, Challenge, Submission, StatCounter, ChallengeStats, SubmissionRollup
+
+        session = self._session(conn)
+        submission, rollup = Submission.__table__, SubmissionRollup.__table__
+        # Attempts archived by retention only survive in the rollups
+        rolled_up = dict(session.execute(
+            select(rollup.c.challenge_id, func.sum(rollup.c.attempts)).group_by(rollup.c.challenge_id)
+        ).all())
+        totals = {
+            USERS: session.execute(select(func.count()).select_from(User.__table__)).scalar(),
+            CHALLENGES: session.execute(select(func.count()).select_from(Challenge.__table__)).scalar(),
+            SUBMISSIONS: session.execute(select(func.count()).select_from(submission)).scalar()
+            + sum(rolled_up.values()),
+            SOLVES: session.execute(
+                select(func.count()).select_from(submission).where(submission.c.is_correct == True)
+            ).scalar(),
+        }
+        session.execute(delete(StatCounter.__table__))
+        session.execute(insert(StatCounter.__table__), [{'name': name, 'value': value} for name, value in totals.items()])
+
+        counts = {
+            row.challenge_id: row for row in session.execute(
+                select(
+                    submission.c.challenge_id,
+                    func.count().label('attempts'),
+                    func.sum(case((submission.c.is_correct == True, 1), else_=0)).label('solves')
+                ).group_by(submission.c.challenge_id)
+            )
+        }
+        first_solves = select(func.min(submission.c.id)).where(
+            submission.c.is_correct == True
+        ).group_by(submission.c.challenge_id)
+        first_bloods = {
+            row.challenge_id: row for row in session.execute(
+                select(submission.c.challenge_id, submission.c.user_id, submission.c.submitted_at)
+                .where(submission.c.id.in_(first_solves))
+            )
+        }
+        rows = []
+        for challenge_id, in session.execute(select(Challenge.id)):
+            count, first = counts.get(challenge_id), first_bloods.get(challenge_id)
+            rows.append({
+                'challenge_id': challenge_id,
+                'solves': count.solves if count else 0,
+                'attempts': (count.attempts if count else 0) + rolled_up.get(challenge_id, 0),
+                'first_blood_user_id': first.user_id if first else None,
+                'first_blood_at': first.submitted_at if first else None,
+            })
+        session.execute(delete(ChallengeStats.__table__))
+        if rows:
+            session.execute(insert(ChallengeStats.__table__), rows)
+        return totals
+
+    def totals(self):
+        from extensions import db
+        from models import StatCounter
+
+        values = dict(db.session.query(StatCounter.name, StatCounter.value).all())
+        return {name: values.get(name, 0) for name in COUNTERS}
+
+    def challenges(self):
+        """Per-challenge stats for the dashboard, one row per challenge."""
+        from extensions import db
+        from models import User, Challenge, ChallengeStats
+
+        rows = db.session.query(
+            Challenge.id, Challenge.title, Challenge.category, Challenge.points, Challenge.is_active,
+            Challenge.minimum_points, Challenge.decay, Challenge.solve_count,
+            ChallengeStats.solves, ChallengeStats.attempts, User.username, ChallengeStats.first_blood_at
+        ).outerjoin(ChallengeStats, ChallengeStats.challenge_id == Challenge.id).outerjoin(
+            User, User.id == ChallengeStats.first_blood_user_id
+        ).order_by(Challenge.id).all()
+        return [
+            ChallengeSummary(
+                row.id, row.title, row.category, row.points,
+                challenge_value(row.points, row.minimum_points, row.decay, row.solve_count or 0),
+                row.is_active, row.solves or 0, row.attempts or 0, row.username, row.first_blood_at
+            )
+            for row in rows
+        ]
@@ -0,0 +1,127 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it the gallery shows originals
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# variant -> bounding box; every variant is written as WebP
+VARIANTS = {
+    'thumb': (320, 320),
+    'web': (1600, 1600),
+}
+RASTER_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp'}
+
+
+def derivative_name(sha256, variant):
+    return f'{sha256}_{variant}.webp'
+
+
+def build_derivatives(source_path, out_dir, sha256):
+    """Write any missing variants of one image. Runs in a worker process."""
+    built = []
+    missing = [v for v in VARIANTS if not os.path.exists(os.path.join(out_dir, derivative_name(sha256, v)))]
+    if not missing:
+        return built
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        for variant in missing:
+            rendition = image.copy()
+            rendition.thumbnail(VARIANTS[variant], Image.LANCZOS)
+            target = os.path.join(out_dir, derivative_name(sha256, variant))
+            temp = f'{target}.{os.getpid()}.tmp'
+            rendition.save(temp, 'WEBP', quality=80 if variant == 'thumb' else 85, method=4)
+            os.replace(temp, target)
+            built.append(variant)
+    return built
+
+
+class DerivativeGenerator:
+    """Builds resized renditions of uploaded images off the request path.
+
+    Work is handed to a process pool that is created lazily in each worker.
+    Derivatives are named after the source's content hash, so they are built
+    once per distinct image and a changed file gets new ones automatically.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.workers = 2
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from extensions import media_store
+
+        self.folder = os.path.join(media_store.folder, 'derivatives')
+        self.workers = app.config.get('MEDIA_DERIVATIVE_WORKERS', 2)
+        os.makedirs(self.folder, exist_ok=True)
+        app.extensions['derivatives'] = self
+        app.jinja_env.globals['media_derivative'] = self.url_path
+
+    @property
+    def enabled(self):
+        return Image is not None and self.workers > 0
+
+    @staticmethod
+    def supports(media):
+        return bool(media.get('sha256')) and media['file'].rsplit('.', 1)[-1].lower() in RASTER_EXTENSIONS
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # spawn, not fork: the worker has threads of its own (e.g. the submission writer)
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, media):
+        """Queue derivative generation for a media reference; returns a Future or None."""
+        from extensions import media_store
+
+        if not self.enabled or not self.supports(media):
+            return None
+        try:
+            future = self._pool().submit(build_derivatives, media_store.path(media['file']), self.folder, media['sha256'])
+        except Exception:
+            # The upload itself already succeeded; the gallery falls back to the original
+            logger.exception('Could not queue derivatives for %s', media['file'])
+            return None
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.error('Derivative generation failed: %s', future.exception())
+
+    def url_path(self, media, variant):
+        """Path of a built derivative relative to the media folder, or None if there isn't one yet."""
+        if not self.supports(media):
+            return None
+        name = derivative_name(media['sha256'], variant)
+        if not os.path.exists(os.path.join(self.folder, name)):
+            return None
+        return f'derivatives/{name}'
+
+    def remove_unreferenced(self, sha256s):
+        """Delete derivatives whose source image is gone. Returns the removed names."""
+        removed = sorted(name for name in os.listdir(self.folder) if name.split('_', 1)[0] not in sha256s)
+        for name in removed:
+            os.remove(os.path.join(self.folder, name))
+        return removed
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -1,3 +1,27 @@
 from flask_sqlalchemy import SQLAlchemy
+from catalog import ChallengeCatalog
+from dashboard_stats import DashboardStats
+from derivatives import DerivativeGenerator
+from leaderboard import Leaderboard
+from live_scoreboard import ScoreboardFeed
+from media_store import MediaStore
+from metrics import Metrics
+from password_hasher import PasswordHasher
+from score_timeline import ScoreTimeline
+from submission_queue import SubmissionQueue
+from submissions import SubmissionEngine
+from user_cache import UserCache
 
 db = SQLAlchemy()
+leaderboard = Leaderboard()
+scoreboard_feed = ScoreboardFeed()
+catalog = ChallengeCatalog()
+media_store = MediaStore()
+derivatives = DerivativeGenerator()
+submissions = SubmissionEngine()
+submission_queue = SubmissionQueue()
+dashboard_stats = DashboardStats()
+metrics = Metrics()
+password_hasher = PasswordHasher()
+user_cache = UserCache()
+score_timeline = ScoreTimeline()
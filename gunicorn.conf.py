@@ -0,0 +1,60 @@
+"""Production gunicorn settings: gunicorn picks this file up from the working directory.
+
+The app is built once in the master (preload_app) with PRODUCTION_STARTUP,
+so schema checks and template compilation happen before the workers fork
+and every worker starts serving immediately. Each worker then opens its own
+database connections; the per-process helpers (scoreboard poller, submission
+writer, password hashing pool) notice the new pid and start on first use.
+
+Workers are gthread, and /scoreboard/stream keeps one thread busy for as
+long as a scoreboard tab is open. Half of each worker's threads are set
+aside for streams (LIVE_SCOREBOARD_MAX_STREAMS = threads // 2). Past
+that the stream answers 503, and the page polls /scoreboard/live every
+LIVE_SCOREBOARD_FALLBACK_SECONDS until a stream frees up. The other half
+of the threads always serves ordinary requests, however many scoreboards
+are open. So every player's scoreboard stays live: threads // 2 of them
+per worker get pushed updates, and the rest are a few seconds behind.
+bench_live_scoreboard.py measures this against a real worker. Setting
+LIVE_SCOREBOARD_MAX_STREAMS yourself overrides the split.
+
+Each worker keeps its own metrics. They are saved to
+METRICS_MULTIPROCESS_DIR (instance/metrics by default), so a /metrics
+scrape answered by any worker reports the whole server. The directory is
+emptied when the server starts.
+
+    gunicorn            # serves app:create_app() with the settings below
+"""
+import glob
+import multiprocessing
+import os
+
+os.environ.setdefault('PRODUCTION_STARTUP', '1')
+os.environ.setdefault('METRICS_MULTIPROCESS_DIR',
+                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = max(int(os.environ.get('GUNICORN_THREADS', 16)), 2)  # one for streams, one for pages at least
+# Read by the app's config, which is loaded after this file
+os.environ.setdefault('LIVE_SCOREBOARD_MAX_STREAMS', str(max(threads // 2, 1)))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+# Workers stay responsive while streams are open; streams end every LIVE_SCOREBOARD_STREAM_SECONDS
+timeout = 60
+keepalive = 5
+
+
+def on_starting(server):
+    # Totals from a previous run would otherwise be added to this one's
+    for path in glob.glob(os.path.join(os.environ['METRICS_MULTIPROCESS_DIR'], '*.json')):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master after startup must not be shared with a worker
+    from extensions import db
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        db.engine.dispose()
@@ -4,7 +4,7 @@ from models import User, Challenge
 def init_db():
     app = create_app()
     with app.app_context():
-        from extensions import db
+        from extensions import db, dashboard_stats
         db.create_all()
 
         # Create admin user
@@ -89,6 +89,8 @@ def init_db():
         for challenge in challenges:
             db.session.add(challenge)
 
+        db.session.flush()
+        dashboard_stats.rebuild()
         db.session.commit()
         print("Database initialized with sample data.")
 
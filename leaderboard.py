@@ -0,0 +1,247 @@
+import random
+import threading
+import time
+from collections import namedtuple
+
+# One row of the scoreboard as handed to templates
+LeaderboardEntry = namedtuple('LeaderboardEntry', ['rank', 'user_id', 'username', 'score'])
+
+
+class _Node:
+    __slots__ = ('key', 'priority', 'left', 'right', 'size')
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+
+
+def _size(node):
+    return node.size if node else 0
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _split(node, key):
+    """Split a treap into (keys < key, keys >= key)."""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    """Merge two treaps where every key in left is smaller than every key in right."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class RankTree:
+    """Order-statistic treap: insert, delete, rank and select in O(log n)."""
+
+    def __init__(self):
+        self.root = None
+
+    def __len__(self):
+        return _size(self.root)
+
+    def insert(self, key):
+        left, right = _split(self.root, key)
+        self.root = _merge(_merge(left, _Node(key)), right)
+
+    def remove(self, key):
+        parent, node = None, self.root
+        while node is not None and node.key != key:
+            parent, node = node, (node.left if key < node.key else node.right)
+        if node is None:
+            return False
+        replacement = _merge(node.left, node.right)
+        if parent is None:
+            self.root = replacement
+        elif parent.left is node:
+            parent.left = replacement
+        else:
+            parent.right = replacement
+        # Walk down again to fix subtree sizes on the path to the removed node
+        walk = self.root
+        while walk is not None and walk is not replacement:
+            walk.size -= 1
+            walk = walk.left if key < walk.key else walk.right
+        return True
+
+    def index_of(self, key):
+        """Number of keys strictly smaller than key."""
+        index, node = 0, self.root
+        while node is not None:
+            if key <= node.key:
+                node = node.left
+            else:
+                index += _size(node.left) + 1
+                node = node.right
+        return index
+
+    def slice(self, start, count):
+        """Return up to count keys in order, starting at position start."""
+        result = []
+        stack, node, skip = [], self.root, start
+        # Descend to the start position, keeping the ancestors we still have to visit
+        while node is not None:
+            left_size = _size(node.left)
+            if skip < left_size:
+                stack.append(node)
+                node = node.left
+            elif skip == left_size:
+                stack.append(node)
+                node = None
+            else:
+                skip -= left_size + 1
+                node = node.right
+        while stack and len(result) < count:
+            node = stack.pop()
+            result.append(node.key)
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+        return result
+
+
+class Leaderboard:
+    """In-process ranked index of non-admin users.
+
+    Keys are (-score, user_id), so the smallest key is rank 1 and ties are
+    broken by registration order. The index is loaded from the database on
+    first use, updated incrementally as scores change and fully reloaded every
+    LEADERBOARD_RESYNC_SECONDS to pick up changes made by other workers.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self._tree = RankTree()
+        self._users = {}  # user_id -> (username, score)
+        self._loaded_at = None
+        self.resync_interval = 60
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.resync_interval = app.config.get('LEADERBOARD_RESYNC_SECONDS', 60)
+        app.extensions['leaderboard'] = self
+
+    @staticmethod
+    def _key(user_id, score):
+        return (-(score or 0), user_id)
+
+    def reload(self):
+        from extensions import db
+        from models import User
+
+        rows = db.session.query(User.id, User.username, User.score).filter(User.role != 'admin').all()
+        tree, users = RankTree(), {}
+        for user_id, username, score in rows:
+            tree.insert(self._key(user_id, score))
+            users[user_id] = (username, score or 0)
+        with self._lock:
+            self._tree, self._users = tree, users
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or (self.resync_interval and time.monotonic() - loaded_at > self.resync_interval):
+            self.reload()
+
+    def update(self, user_id, username, score):
+        """Insert a user or move them to their new score."""
+        with self._lock:
+            if self._loaded_at is None:
+                return  # Picked up by the first load
+            previous = self._users.get(user_id)
+            if previous is not None:
+                self._tree.remove(self._key(user_id, previous[1]))
+            self._tree.insert(self._key(user_id, score))
+            self._users[user_id] = (username, score or 0)
+
+    def remove(self, user_id):
+        with self._lock:
+            previous = self._users.pop(user_id, None)
+            if previous is not None:
+                self._tree.remove(self._key(user_id, previous[1]))
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._tree)
+
+    def rank_of(self, user_id):
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            return self._tree.index_of(self._key(user_id, entry[1])) + 1
+
+    def entry(self, user_id):
+        """Return the user's LeaderboardEntry, or None if they aren't ranked."""
+        self._ensure_loaded()
+        with self._lock:
+            if user_id not in self._users:
+                return None
+            username, score = self._users[user_id]
+            return LeaderboardEntry(self._tree.index_of(self._key(user_id, score)) + 1, user_id, username, score)
+
+    def _entries(self, start, count):
+        entries = []
+        for offset, (_, user_id) in enumerate(self._tree.slice(start, count)):
+            username, score = self._users[user_id]
+            entries.append(LeaderboardEntry(start + offset + 1, user_id, username, score))
+        return entries
+
+    def page(self, page, per_page):
+        """Return (entries, total) for a 1-based page of the leaderboard."""
+        self._ensure_loaded()
+        page = max(page, 1)
+        with self._lock:
+            return self._entries((page - 1) * per_page, per_page), len(self._tree)
+
+    def after(self, score, user_id, count):
+        """Return (entries, total) for up to count entries ranked below (score, user_id).
+
+        Keyset pagination: the page starts where that entry is or would be,
+        so pages don't shift when players above the cursor gain points.
+        """
+        self._ensure_loaded()
+        key = self._key(user_id, score)
+        with self._lock:
+            start = self._tree.index_of(key)
+            if self._tree.slice(start, 1) == [key]:
+                start += 1
+            return self._entries(start, count), len(self._tree)
+
+    def around(self, user, radius=0):
+        """Return the user's entry with up to radius neighbours on each side."""
+        self._ensure_loaded()
+        with self._lock:
+            if user.id not in self._users:
+                self.update(user.id, user.username, user.score)
+            index = self._tree.index_of(self._key(user.id, self._users[user.id][1]))
+            start = max(index - radius, 0)
+            return self._entries(start, index - start + radius + 1)
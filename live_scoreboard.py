@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Queued in place of an update when a subscriber fell too far behind
+_RESYNC = object()
+
+
+class ScoreboardFeed:
+    """Per-worker broadcaster behind the /scoreboard/stream Server-Sent Events feed.
+
+    Every score change is published once as a delta {user_id, username,
+    score, rank} and fanned out to the queues of this worker's subscribers.
+    Solves recorded in this worker are published directly; one poller thread
+    per worker picks up solves recorded by other workers from the submission
+    table, so the database is polled once per worker no matter how many
+    clients are connected.
+
+    Event ids are "<epoch>-<seq>". A client reconnecting with a Last-Event-ID
+    from this worker that is still in the backlog is sent the missed deltas;
+    anyone else is sent a fresh snapshot.
+
+    Each open stream holds a request thread of the worker. To leave threads
+    for ordinary requests, subscribe() refuses more than
+    LIVE_SCOREBOARD_MAX_STREAMS streams per worker. Every stream also ends
+    after LIVE_SCOREBOARD_STREAM_SECONDS, and EventSource then reconnects
+    with its Last-Event-ID. That way held threads keep coming free and
+    clients spread across workers.
+
+    Clients turned away fetch poll() from /scoreboard/live every
+    LIVE_SCOREBOARD_FALLBACK_SECONDS instead. That is the same snapshot
+    read from the in-memory leaderboard, so it costs a short request and
+    no held thread. The poller keeps running while anyone has polled
+    recently, so those snapshots include other workers' solves too.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.epoch = uuid.uuid4().hex[:8]
+        self.backlog_size = 1000
+        self.subscriber_queue_size = 256
+        self.poll_interval = 2.0
+        self.heartbeat = 15.0
+        self.snapshot_size = 50
+        self.max_streams = 4
+        self.stream_seconds = 300.0
+        self.fallback_seconds = 5.0
+        self._polled_at = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._backlog = deque(maxlen=self.backlog_size)
+        self._subscribers = set()
+        self._poller = None
+        self._pid = None
+        self._last_submission_id = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backlog_size = app.config.get('LIVE_SCOREBOARD_BACKLOG', self.backlog_size)
+        self.subscriber_queue_size = app.config.get('LIVE_SCOREBOARD_QUEUE_SIZE', self.subscriber_queue_size)
+        self.poll_interval = app.config.get('LIVE_SCOREBOARD_POLL_SECONDS', self.poll_interval)
+        self.heartbeat = app.config.get('LIVE_SCOREBOARD_HEARTBEAT_SECONDS', self.heartbeat)
+        self.snapshot_size = app.config.get('SCOREBOARD_PAGE_SIZE', self.snapshot_size)
+        self.max_streams = app.config.get('LIVE_SCOREBOARD_MAX_STREAMS', self.max_streams)
+        self.stream_seconds = app.config.get('LIVE_SCOREBOARD_STREAM_SECONDS', self.stream_seconds)
+        self.fallback_seconds = app.config.get('LIVE_SCOREBOARD_FALLBACK_SECONDS', self.fallback_seconds)
+        self._backlog = deque(maxlen=self.backlog_size)
+        app.extensions['scoreboard_feed'] = self
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, user_id, username, score, rank):
+        """Record one score change and hand it to every subscriber."""
+        with self._lock:
+            self._seq += 1
+            event_id = f'{self.epoch}-{self._seq}'
+            delta = {'user_id': user_id, 'username': username, 'score': score, 'rank': rank}
+            self._backlog.append((self._seq, delta))
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event_id, delta))
+            except queue.Full:
+                # Too slow to keep up: throw away what it has and start it over from a snapshot
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(_RESYNC)
+        return event_id
+
+    def subscribe(self):
+        """Register a subscriber queue, or return None when the worker already holds max_streams."""
+        self._ensure_poller()
+        subscriber = queue.Queue(maxsize=self.subscriber_queue_size)
+        with self._lock:
+            if self.max_streams and len(self._subscribers) >= self.max_streams:
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def missed_since(self, last_event_id):
+        """Deltas after last_event_id, or None if they can't be replayed."""
+        epoch, _, seq = (last_event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        with self._lock:
+            if seq > self._seq or (self._backlog and self._backlog[0][0] > seq + 1):
+                return None
+            return [(f'{self.epoch}-{s}', delta) for s, delta in self._backlog if s > seq]
+
+    def current_event_id(self):
+        return f'{self.epoch}-{self._seq}'
+
+    # Cross-worker polling
+
+    def _ensure_poller(self):
+        if self._poller is not None and self._pid == os.getpid() and self._poller.is_alive():
+            return
+        with self._lock:
+            if self._poller is None or self._pid != os.getpid() or not self._poller.is_alive():
+                self._pid = os.getpid()
+                self._last_submission_id = None
+                self._poller = threading.Thread(target=self._poll, name='scoreboard-poller', daemon=True)
+                self._poller.start()
+
+    def _wanted(self):
+        polled_at = self._polled_at
+        recently_polled = polled_at is not None and time.monotonic() - polled_at < 3 * self.fallback_seconds
+        return bool(self._subscribers) or recently_polled or self._last_submission_id is None
+
+    def _poll(self):
+        while True:
+            if self._wanted():
+                with self.app.app_context():
+                    try:
+                        self.poll_once()
+                    except Exception:
+                        logger.exception('Scoreboard poll failed')
+            time.sleep(self.poll_interval)
+
+    def poll_once(self):
+        """Publish score changes from solves this worker hasn't seen yet."""
+        from extensions import db
+        from models import Challenge, Submission
+
+        if self._last_submission_id is None:
+            self._last_submission_id = db.session.query(db.func.max(Submission.id)).scalar() or 0
+            return
+        rows = db.session.query(Submission.id, Submission.user_id, Submission.challenge_id).filter(
+            Submission.id > self._last_submission_id,
+            Submission.is_correct == True
+        ).order_by(Submission.id).all()
+        if not rows:
+            return
+        self._last_submission_id = rows[-1].id
+        user_ids = {row.user_id for row in rows}
+        # A solve of a dynamic challenge moves everyone who solved it before
+        dynamic = db.session.query(Challenge.id).filter(
+            Challenge.id.in_({row.challenge_id for row in rows}),
+            Challenge.minimum_points.isnot(None),
+            Challenge.decay > 0
+        )
+        user_ids.update(user_id for user_id, in db.session.query(Submission.user_id).filter(
+            Submission.challenge_id.in_(dynamic), Submission.is_correct == True
+        ))
+        self.refresh_users(user_ids)
+
+    def refresh_users(self, user_ids, chunk_size=500):
+        """Re-read the scores of user_ids and publish the ones this worker hasn't seen."""
+        from extensions import db, leaderboard, user_cache
+        from models import User
+
+        user_ids = list(user_ids)
+        for user_id in user_ids:
+            user_cache.invalidate(user_id)
+        for start in range(0, len(user_ids), chunk_size):
+            users = db.session.query(User.id, User.username, User.score).filter(
+                User.id.in_(user_ids[start:start + chunk_size]), User.role != 'admin'
+            ).all()
+            for user_id, username, score in users:
+                known = leaderboard.entry(user_id)
+                if known is not None and known.score == score:
+                    continue  # Already published by this worker
+                leaderboard.update(user_id, username, score)
+                self.publish(user_id, username, score, leaderboard.rank_of(user_id))
+
+    # Event stream
+
+    @staticmethod
+    def _format(event, data, event_id=None):
+        lines = []
+        if event_id:
+            lines.append(f'id: {event_id}')
+        lines.append(f'event: {event}')
+        lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+        return '\n'.join(lines) + '\n\n'
+
+    def _snapshot(self, user_id, is_admin):
+        from extensions import db, leaderboard
+
+        if is_admin:
+            entries, total = leaderboard.page(1, self.snapshot_size)
+        else:
+            entry = leaderboard.entry(user_id)
+            entries, total = ([entry] if entry else []), len(leaderboard)
+        # Don't hold a pooled connection for the lifetime of the stream
+        db.session.close()
+        return {'total': total, 'entries': [entry._asdict() for entry in entries]}
+
+    def poll(self, user_id, is_admin):
+        """The snapshot a stream would start with, for clients polling instead."""
+        self._polled_at = time.monotonic()
+        self._ensure_poller()
+        return self._snapshot(user_id, is_admin)
+
+    def stream(self, subscriber, user_id, is_admin, last_event_id=None):
+        """Generate the SSE stream for one client, from a queue returned by subscribe().
+
+        Admins receive every delta; players only receive their own rank and
+        score, and only when one of them changes. The stream ends after
+        stream_seconds and unsubscribes when it does.
+        """
+        from extensions import leaderboard
+
+        deadline = time.monotonic() + self.stream_seconds
+        try:
+            yield 'retry: 3000\n\n'
+            missed = self.missed_since(last_event_id)
+            if missed is None:
+                yield self._format('snapshot', self._snapshot(user_id, is_admin), self.current_event_id())
+                missed = []
+            mine = leaderboard.entry(user_id) if not is_admin else None
+            pending = deque(missed)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if pending:
+                    item = pending.popleft()
+                else:
+                    try:
+                        item = subscriber.get(timeout=min(self.heartbeat, remaining))
+                    except queue.Empty:
+                        yield ': keep-alive\n\n'
+                        continue
+                if item is _RESYNC:
+                    yield self._format('snapshot', self._snapshot(user_id, is_admin), self.current_event_id())
+                    continue
+                event_id, delta = item
+                if is_admin:
+                    yield self._format('update', delta, event_id)
+                    continue
+                # Anyone's solve can move a player's rank
+                entry = leaderboard.entry(user_id)
+                if entry is not None and entry != mine:
+                    mine = entry
+                    yield self._format('update', entry._asdict(), event_id)
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,177 @@
+import errno
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+
+from flask import abort, make_response, send_file
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+# Stored files and their derivatives are named after their content hash
+FINGERPRINTED = re.compile(r'^(?:derivatives/)?([0-9a-f]{64}(?:_[a-z]+)?)\.[a-z0-9]+$')
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+def _format_size(size):
+    for unit in ('bytes', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
+
+
+class MediaStore:
+    """Content-addressed storage for challenge attachments.
+
+    Uploads are streamed to a temporary file in fixed-size chunks while being
+    hashed, so memory use doesn't grow with the file and oversized uploads are
+    rejected as soon as they cross MAX_MEDIA_FILE_SIZE. The finished file is
+    stored as <sha256>.<ext>; identical content uploaded twice, under any name,
+    is kept on disk once. Challenge.media_files holds references of the form
+    {"name": <original filename>, "file": <stored filename>, "sha256": ..., "size": ...}.
+
+    Uploads in progress live in MEDIA_TEMP_FOLDER (instance/media-tmp by
+    default), outside the served directory, so a half-written file can't be
+    downloaded. It should be on the same filesystem as MEDIA_FOLDER so the
+    finished file is renamed into place. Otherwise it is copied to a
+    dot-prefixed name next to the store first, and send() never serves
+    dotfiles.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.temp_folder = None
+        self.max_file_size = 50 * 1024 * 1024
+        self.chunk_size = 64 * 1024
+        self.max_age = 365 * 24 * 3600
+        self.accel_prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = os.path.join(app.root_path, app.config.get('MEDIA_FOLDER', 'static/uploads/challenges'))
+        self.max_file_size = app.config.get('MAX_MEDIA_FILE_SIZE', self.max_file_size)
+        self.chunk_size = app.config.get('MEDIA_CHUNK_SIZE', self.chunk_size)
+        self.max_age = app.config.get('MEDIA_MAX_AGE', self.max_age)
+        self.accel_prefix = app.config.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+        self.temp_folder = app.config.get('MEDIA_TEMP_FOLDER') or os.path.join(app.instance_path, 'media-tmp')
+        os.makedirs(self.folder, exist_ok=True)
+        os.makedirs(self.temp_folder, exist_ok=True)
+        app.extensions['media_store'] = self
+
+    def path(self, stored_name):
+        return os.path.join(self.folder, stored_name)
+
+    def save(self, file):
+        """Store an uploaded FileStorage and return its media reference."""
+        name = secure_filename(file.filename)
+        return self.save_stream(file.stream, name)
+
+    def save_stream(self, stream, name):
+        ext = name.rsplit('.', 1)[1].lower() if '.' in name else 'bin'
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_folder, prefix='upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_file_size:
+                        raise MediaTooLarge(f'{name} is larger than the {_format_size(self.max_file_size)} limit')
+                    digest.update(chunk)
+                    out.write(chunk)
+            stored_name = f'{digest.hexdigest()}.{ext}'
+            if os.path.exists(self.path(stored_name)):
+                os.remove(temp_path)
+            else:
+                self._install(temp_path, stored_name)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return {'name': name, 'file': stored_name, 'sha256': digest.hexdigest(), 'size': size}
+
+    def _install(self, temp_path, stored_name):
+        try:
+            os.replace(temp_path, self.path(stored_name))
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Different filesystems: copy next to the store under a name send() refuses, then rename
+            fd, staged = tempfile.mkstemp(dir=self.folder, prefix='.upload-')
+            os.close(fd)
+            try:
+                shutil.copyfile(temp_path, staged)
+                os.replace(staged, self.path(stored_name))
+            except BaseException:
+                os.remove(staged)
+                raise
+            os.remove(temp_path)
+
+    def adopt(self, legacy_name):
+        """Copy a pre-content-addressing upload into the store and return its reference.
+
+        The legacy file is left in place; remove it once the new reference is committed.
+        """
+        with open(self.path(legacy_name), 'rb') as stream:
+            # Legacy names carry a "<challenge id>_" or "temp_" prefix
+            prefix, _, rest = legacy_name.partition('_')
+            name = rest if rest and (prefix.isdigit() or prefix == 'temp') else legacy_name
+            return self.save_stream(stream, name)
+
+    def send(self, filename):
+        """Serve a stored file or derivative.
+
+        Content-addressed names never change content, so they get a strong ETag
+        from the hash and a year-long immutable Cache-Control. Legacy names
+        are revalidated on every use. Byte ranges and conditional requests are
+        handled by send_file. With MEDIA_ACCEL_REDIRECT_PREFIX set the body is
+        left to nginx via X-Accel-Redirect; USE_X_SENDFILE does the same for
+        servers that understand X-Sendfile.
+        """
+        # Dotfiles are uploads still being copied in
+        if any(part.startswith('.') for part in filename.split('/')):
+            abort(404)
+        path = safe_join(self.folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        fingerprint = FINGERPRINTED.match(filename)
+
+        if self.accel_prefix:
+            response = make_response('')
+            response.headers['X-Accel-Redirect'] = self.accel_prefix.rstrip('/') + '/' + filename
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            if fingerprint:
+                response.set_etag(fingerprint.group(1))
+        else:
+            etag = fingerprint.group(1) if fingerprint else True
+            response = send_file(path, conditional=True, etag=etag, max_age=self.max_age if fingerprint else 0)
+            response.accept_ranges = 'bytes'
+
+        if fingerprint:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    def stored_files(self):
+        return {name for name in os.listdir(self.folder)
+                if not name.startswith('.') and os.path.isfile(self.path(name))}
+
+    def remove_unreferenced(self, referenced):
+        """Delete stored files no challenge refers to. Returns the removed names."""
+        removed = sorted(self.stored_files() - set(referenced))
+        for name in removed:
+            os.remove(self.path(name))
+        return removed
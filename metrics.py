@@ -0,0 +1,363 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+STATEMENT_KINDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE'}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(values, other):
+        for label_values, value in other.items():
+            values[label_values] = values.get(label_values, 0) + value
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted((self.snapshot() if values is None else values).items()):
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {label_values: list(series) for label_values, series in self._values.items()}
+
+    @staticmethod
+    def merge(values, other):
+        for label_values, series in other.items():
+            mine = values.get(label_values)
+            values[label_values] = list(series) if mine is None else [a + b for a, b in zip(mine, series)]
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, series in sorted((self.snapshot() if values is None else values).items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, [("le", bound)])} {count}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, [("le", "+Inf")])} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, label_values)} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labels, label_values)} {series[-1]}')
+        return lines
+
+
+class Metrics:
+    """Request, SQL and template timings, rendered in the Prometheus text format.
+
+    Every request is timed from before_request to teardown and counted by
+    endpoint and status. SQLAlchemy cursor events on db.engine time every
+    statement; statements run while handling a request are also attributed
+    to it. db_write_lock_seconds times the first write of each transaction
+    and each commit, which on SQLite is where waiting for the database lock
+    shows up. Requests slower than SLOW_REQUEST_SECONDS are logged with the
+    statements they ran.
+
+    Values are kept per process. With METRICS_MULTIPROCESS_DIR set, as
+    gunicorn.conf.py does, every worker writes a snapshot of its values to
+    <dir>/<pid>.json every METRICS_FLUSH_SECONDS and at exit. A scrape
+    reaching any worker writes its own snapshot and reports the sum over
+    all files. Counters and histograms of workers that have exited stay in
+    the sum, so totals never go backwards. Gauges only count live workers.
+    Without the directory, a scrape reports the worker that answered it.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.slow_request_seconds = 1.0
+        self.slow_request_max_queries = 50
+        self._local = threading.local()
+        self._gauges = []  # (name, help, callable)
+        self._totals = []  # (name, help, callable) for running totals kept elsewhere
+        self.multiprocess_dir = None
+        self.flush_seconds = 1.0
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+        self.requests = Counter('http_requests_total', 'Requests handled.', ['endpoint', 'method', 'status'])
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Time to handle a request.', ['endpoint', 'method'])
+        self.request_queries = Histogram(
+            'http_request_db_queries', 'SQL statements executed per request.', ['endpoint'], QUERY_COUNT_BUCKETS)
+        self.request_query_seconds = Histogram(
+            'http_request_db_seconds', 'Time per request spent in SQL statements.', ['endpoint'])
+        self.query_seconds = Histogram('db_query_duration_seconds', 'Time to execute one SQL statement.', ['kind'])
+        self.lock_seconds = Histogram(
+            'db_write_lock_seconds', 'Time for the first write of a transaction and for commits.', ['phase'])
+        self.template_seconds = Histogram('template_render_seconds', 'Time to render a template.', ['template'])
+        self.password_seconds = Histogram('password_hash_seconds', 'Time to hash or check a password.', ['operation'])
+        self.slow_requests = Counter('http_slow_requests_total', 'Requests over the slow request threshold.', ['endpoint'])
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from flask import before_render_template, template_rendered
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        from extensions import db
+
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.slow_request_seconds = app.config.get('SLOW_REQUEST_SECONDS', self.slow_request_seconds)
+        self.slow_request_max_queries = app.config.get('SLOW_REQUEST_MAX_QUERIES', self.slow_request_max_queries)
+        self.multiprocess_dir = app.config.get('METRICS_MULTIPROCESS_DIR')
+        self.flush_seconds = app.config.get('METRICS_FLUSH_SECONDS', self.flush_seconds)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+        if self.multiprocess_dir:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+
+        app.before_request(self._start_request)
+        app.after_request(self._count_response)
+        app.teardown_request(self._finish_request)
+        before_render_template.connect(self._start_template, app)
+        template_rendered.connect(self._finish_template, app)
+        with app.app_context():
+            event.listen(db.engine, 'begin', self._begin)
+            event.listen(db.engine, 'before_cursor_execute', self._before_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_execute)
+            event.listen(db.engine, 'commit', self._before_commit)
+        event.listen(Session, 'after_commit', self._after_commit)
+
+        from extensions import submission_queue, scoreboard_feed
+        self.gauge('submission_queue_depth', 'Incorrect submissions waiting to be written.',
+                   lambda: submission_queue.depth)
+        self.total('submission_queue_dropped_total', 'Incorrect submissions dropped because the queue was full.',
+                   lambda: submission_queue.dropped)
+        self.gauge('scoreboard_stream_subscribers', 'Open /scoreboard/stream connections.',
+                   lambda: scoreboard_feed.subscriber_count)
+
+    def gauge(self, name, help, read):
+        """Report read() as a gauge on every scrape."""
+        self._gauges.append((name, help, read))
+
+    def total(self, name, help, read):
+        """Report read(), a count that only goes up, as a counter on every scrape."""
+        self._totals.append((name, help, read))
+
+    @contextmanager
+    def timed(self, histogram, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - started, *label_values)
+
+    # Requests
+
+    def _start_request(self):
+        self._ensure_writer()
+        g._metrics_started = time.perf_counter()
+        self._local.request = {'count': 0, 'seconds': 0.0, 'statements': []}
+
+    def _count_response(self, response):
+        g._metrics_status = response.status_code
+        # Event streams are torn down when the client goes away, not when they're slow
+        g._metrics_streamed = response.mimetype == 'text/event-stream'
+        return response
+
+    def _finish_request(self, exc):
+        started = g.pop('_metrics_started', None)
+        state, self._local.request = getattr(self._local, 'request', None), None
+        if started is None or state is None:
+            return
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        status = 500 if exc is not None else g.pop('_metrics_status', 500)
+        self.requests.inc(endpoint, request.method, status)
+        self.request_seconds.observe(elapsed, endpoint, request.method)
+        self.request_queries.observe(state['count'], endpoint)
+        self.request_query_seconds.observe(state['seconds'], endpoint)
+        if self.slow_request_seconds and elapsed > self.slow_request_seconds and not g.pop('_metrics_streamed', False):
+            self.slow_requests.inc(endpoint)
+            lines = [f'  {seconds * 1000:8.1f} ms  {statement}' for statement, seconds in state['statements']]
+            if state['count'] > len(state['statements']):
+                lines.append(f'  ... {state["count"] - len(state["statements"])} more')
+            logger.warning('Slow request %s %s (%s): %.0f ms, %d queries taking %.0f ms%s',
+                           request.method, request.path, endpoint, elapsed * 1000,
+                           state['count'], state['seconds'] * 1000, ''.join('\n' + line for line in lines))
+
+    # SQL
+
+    def _begin(self, conn):
+        conn.info['metrics_wrote'] = False
+        self._local.commit_started = None
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        kind = statement.lstrip()[:6].upper()
+        kind = kind if kind in STATEMENT_KINDS else 'OTHER'
+        self.query_seconds.observe(elapsed, kind)
+        if kind in ('INSERT', 'UPDATE', 'DELETE') and not conn.info.get('metrics_wrote', True):
+            conn.info['metrics_wrote'] = True
+            self.lock_seconds.observe(elapsed, 'first_write')
+        state = getattr(self._local, 'request', None)
+        if state is not None:
+            state['count'] += 1
+            state['seconds'] += elapsed
+            if len(state['statements']) < self.slow_request_max_queries:
+                state['statements'].append((' '.join(statement.split()), elapsed))
+
+    def _before_commit(self, conn):
+        self._local.commit_started = time.perf_counter()
+
+    def _after_commit(self, session):
+        started, self._local.commit_started = getattr(self._local, 'commit_started', None), None
+        if started is not None:
+            self.lock_seconds.observe(time.perf_counter() - started, 'commit')
+
+    # Templates
+
+    def _start_template(self, app, template, context, **extra):
+        self._local.templates = getattr(self._local, 'templates', [])
+        self._local.templates.append(time.perf_counter())
+
+    def _finish_template(self, app, template, context, **extra):
+        stack = getattr(self._local, 'templates', None)
+        if stack:
+            self.template_seconds.observe(time.perf_counter() - stack.pop(), template.name or 'string')
+
+    # Exposition
+
+    @property
+    def _metrics(self):
+        return (self.requests, self.request_seconds, self.request_queries, self.request_query_seconds,
+                self.slow_requests, self.query_seconds, self.lock_seconds, self.template_seconds,
+                self.password_seconds)
+
+    def _snapshot(self):
+        return {
+            'metrics': {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                        for metric in self._metrics},
+            'totals': {name: read() for name, _, read in self._totals},
+            'gauges': {name: read() for name, _, read in self._gauges},
+        }
+
+    def _ensure_writer(self):
+        if not self.multiprocess_dir or self._writer_pid == os.getpid():
+            return
+        with self._writer_lock:
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                threading.Thread(target=self._write_periodically, name='metrics-writer', daemon=True).start()
+                atexit.register(self.write)
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.write()
+
+    def write(self):
+        """Save this process's values to the multiprocess directory."""
+        path = os.path.join(self.multiprocess_dir, f'{os.getpid()}.json')
+        try:
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(self._snapshot(), f, separators=(',', ':'))
+            os.replace(f'{path}.tmp', path)
+        except (OSError, ValueError):
+            logger.exception('Could not write metrics to %s', path)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _collect(self):
+        """Sum the snapshots of every worker. Returns (metric values, totals, gauges)."""
+        self.write()
+        values = {metric.name: {} for metric in self._metrics}
+        merge = {metric.name: metric.merge for metric in self._metrics}
+        totals, gauges = {}, {}
+        for path in glob.glob(os.path.join(self.multiprocess_dir, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+                pid = int(os.path.basename(path)[:-len('.json')])
+            except (OSError, ValueError):
+                continue  # Written by something else, or gone since the listing
+            for name, series in snapshot['metrics'].items():
+                if name in merge:
+                    merge[name](values[name], {tuple(labels): value for labels, value in series})
+            for name, value in snapshot['totals'].items():
+                totals[name] = totals.get(name, 0) + value
+            if pid == os.getpid() or self._alive(pid):
+                for name, value in snapshot['gauges'].items():
+                    gauges[name] = gauges.get(name, 0) + value
+        return values, totals, gauges
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        if self.multiprocess_dir:
+            values, totals, gauges = self._collect()
+        else:
+            values = {metric.name: metric.snapshot() for metric in self._metrics}
+            totals = {name: read() for name, _, read in self._totals}
+            gauges = {name: read() for name, _, read in self._gauges}
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(values[metric.name]))
+        for kind, readers, current in (('counter', self._totals, totals), ('gauge', self._gauges, gauges)):
+            for name, help, _ in readers:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {current.get(name, 0)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,161 @@
+"""Schema migrations for databases created before the current models.
+
+db.create_all() only creates missing tables, so indexes and columns added to
+existing tables are applied here. Each migration runs in its own transaction
+and is recorded in the schema_version table; the version row is inserted
+first so that concurrent workers racing through startup apply it once.
+"""
+import logging
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, func, inspect, select, text, update
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return decorator
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version():
+    from extensions import db
+    from models import SchemaVersion
+
+    return db.session.query(func.max(SchemaVersion.version)).scalar() or 0
+
+
+def _create_indexes(conn, table, names):
+    # Expression indexes aren't reflected, so rely on IF NOT EXISTS instead of inspection
+    for index in table.indexes:
+        if index.name in names:
+            ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+            conn.execute(text(ddl.replace('INDEX ', 'INDEX IF NOT EXISTS ', 1)))
+
+
+def upgrade():
+    """Apply pending migrations. Returns the list of versions applied."""
+    from extensions import db
+    from models import SchemaVersion
+
+    applied = []
+    done = current_version()
+    for version, description, apply in MIGRATIONS:
+        if version <= done:
+            continue
+        claimed = False
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(SchemaVersion.__table__.insert().values(version=version, description=description))
+                claimed = True
+                apply(conn)
+        except IntegrityError:
+            if claimed:
+                # The migration itself failed, e.g. a unique index over duplicate data
+                logger.exception('Migration %d failed: %s', version, description)
+                raise
+            # Another worker applied this migration first
+            continue
+        logger.info('Applied migration %d: %s', version, description)
+        applied.append(version)
+    return applied
+
+
+@migration(1, 'Unique index for correct submissions')
+def _unique_solves(conn):
+    from models import Challenge, Submission, User
+
+    submission, challenge, user = Submission.__table__, Challenge.__table__, User.__table__
+    if 'uq_submission_solve' not in {i['name'] for i in inspect(conn).get_indexes('submission')}:
+        # Older read-then-write solves could double count; keep only the earliest
+        first_solves = select(func.min(submission.c.id)).where(
+            submission.c.is_correct == True
+        ).group_by(submission.c.user_id, submission.c.challenge_id)
+        duplicate = and_(submission.c.is_correct == True, submission.c.id.notin_(first_solves))
+        # Scores were static then, so each duplicate added the challenge's points once more
+        overcounted = Counter()
+        for user_id, points in conn.execute(
+            select(submission.c.user_id, challenge.c.points)
+            .select_from(submission.join(challenge, challenge.c.id == submission.c.challenge_id))
+            .where(duplicate)
+        ):
+            overcounted[user_id] += points or 0
+        conn.execute(update(submission).where(duplicate).values(is_correct=False))
+        if overcounted:
+            conn.execute(
+                update(user).where(user.c.id == bindparam('_id')).values(score=user.c.score - bindparam('points')),
+                [{'_id': user_id, 'points': points} for user_id, points in overcounted.items()]
+            )
+            logger.warning('Removed duplicate solves worth %d points from %d users',
+                           sum(overcounted.values()), len(overcounted))
+        # Solve counts don't exist yet; migration 5 counts them from the remaining solves
+    _create_indexes(conn, submission, {'uq_submission_solve'})
+
+
+@migration(2, 'Indexes for submission lookups, score ordering and case-insensitive logins')
+def _hot_path_indexes(conn):
+    from models import User, Challenge, Submission
+
+    _create_indexes(conn, User.__table__, {'ix_user_username_lower', 'ix_user_email_lower', 'ix_user_score'})
+    _create_indexes(conn, Challenge.__table__, {'ix_challenge_is_active'})
+    _create_indexes(conn, Submission.__table__, {'ix_submission_user_challenge_correct', 'ix_submission_challenge'})
+
+
+@migration(3, 'Version counter for the challenge catalog cache')
+def _catalog_version(conn):
+    from models import CacheVersion
+
+    table = CacheVersion.__table__
+    if conn.execute(select(table.c.name).where(table.c.name == 'catalog')).first() is None:
+        conn.execute(table.insert().values(name='catalog', version=1, updated_at=datetime.utcnow()))
+
+
+@migration(4, 'Backfill the admin dashboard counters')
+def _dashboard_stats(conn):
+    from extensions import dashboard_stats
+
+    dashboard_stats.rebuild(conn)
+
+
+@migration(5, 'Dynamic scoring columns and solve counts')
+def _dynamic_scoring(conn):
+    from models import Challenge, Submission, User
+
+    columns = {c['name'] for c in inspect(conn).get_columns('challenge')}
+    for name, ddl in (('minimum_points', 'INTEGER'), ('decay', 'INTEGER'),
+                      ('solve_count', 'INTEGER NOT NULL DEFAULT 0')):
+        if name not in columns:
+            conn.execute(text(f'ALTER TABLE challenge ADD COLUMN {name} {ddl}'))
+    submission, user = Submission.__table__, User.__table__
+    solves = select(func.count()).select_from(submission.join(user, user.c.id == submission.c.user_id)).where(
+        submission.c.challenge_id == Challenge.__table__.c.id,
+        submission.c.is_correct == True,
+        func.coalesce(user.c.role, 'user') != 'admin'
+    ).scalar_subquery()
+    conn.execute(update(Challenge.__table__).values(solve_count=solves))
+
+
+@migration(6, 'Backfill the score timeline')
+def _score_timeline(conn):
+    from extensions import score_timeline
+
+    score_timeline.rebuild(conn)
+
+
+@migration(7, 'Rollup table for archived incorrect submissions')
+def _submission_rollups(conn):
+    from models import SubmissionRollup
+
+    SubmissionRollup.__table__.create(conn, checkfirst=True)
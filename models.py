@@ -1,7 +1,7 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from flask_login import UserMixin
-from extensions import db
+from extensions import db, metrics, password_hasher
+from scoring import challenge_value
 import json
 
 class User(UserMixin, db.Model):
@@ -14,14 +14,21 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        with metrics.timed(metrics.password_seconds, 'hash'):
+            self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        with metrics.timed(metrics.password_seconds, 'check'):
+            return password_hasher.check(self.password_hash, password)
 
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Login and registration match usernames and emails case-insensitively
+db.Index('ix_user_username_lower', db.func.lower(User.username))
+db.Index('ix_user_email_lower', db.func.lower(User.email))
+db.Index('ix_user_score', User.score)
+
 class Challenge(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -31,12 +38,35 @@ class Challenge(db.Model):
     points = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
-    media_files = db.Column(db.Text, default='[]')  # JSON list of uploaded filenames
+    media_files = db.Column(db.Text, default='[]')  # JSON list of media references (see MediaStore)
     crypto_type = db.Column(db.String(20), default='')  # 'encrypted' or 'decrypted' for cryptography challenges
+    # Dynamic scoring (see scoring.py): worth minimum_points after decay solves; both unset keeps points fixed
+    minimum_points = db.Column(db.Integer)
+    decay = db.Column(db.Integer)
+    solve_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Non-admin solves
+
+    __table_args__ = (
+        db.Index('ix_challenge_is_active', 'is_active'),
+    )
+
+    @property
+    def is_dynamic(self):
+        return self.minimum_points is not None and bool(self.decay)
+
+    @property
+    def value(self):
+        return challenge_value(self.points, self.minimum_points, self.decay, self.solve_count or 0)
 
     def get_media_files(self):
         return json.loads(self.media_files) if self.media_files else []
 
+    def get_media(self):
+        # Uploads from before content-addressed storage are bare filenames
+        return [
+            media if isinstance(media, dict) else {'name': media, 'file': media, 'sha256': None, 'size': None}
+            for media in self.get_media_files()
+        ]
+
     def set_media_files(self, files):
         self.media_files = json.dumps(files)
 
@@ -54,5 +84,79 @@ class Submission(db.Model):
     user = db.relationship('User', backref=db.backref('submissions', lazy=True))
     challenge = db.relationship('Challenge', backref=db.backref('submissions', lazy=True))
 
+    __table_args__ = (
+        # A user can hold at most one correct submission per challenge
+        db.Index('uq_submission_solve', 'user_id', 'challenge_id', unique=True,
+                 sqlite_where=db.text('is_correct = 1'), postgresql_where=db.text('is_correct')),
+        db.Index('ix_submission_user_challenge_correct', 'user_id', 'challenge_id', 'is_correct'),
+        db.Index('ix_submission_challenge', 'challenge_id'),
+    )
+
     def __repr__(self):
         return f'<Submission {self.user.username} - {self.challenge.title}>'
+
+class SubmissionRollup(db.Model):
+    # Incorrect attempts per user, challenge and hour, once retention has archived the rows
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    challenge_id = db.Column(db.Integer, db.ForeignKey('challenge.id'), primary_key=True, autoincrement=False)
+    hour = db.Column(db.DateTime, primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_submission_rollup_challenge', 'challenge_id'),
+    )
+
+    def __repr__(self):
+        return f'<SubmissionRollup {self.user_id}/{self.challenge_id} {self.hour}: {self.attempts}>'
+
+class StatCounter(db.Model):
+    # Running totals for the admin dashboard, see DashboardStats
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatCounter {self.name}={self.value}>'
+
+class ChallengeStats(db.Model):
+    challenge_id = db.Column(db.Integer, db.ForeignKey('challenge.id'), primary_key=True, autoincrement=False)
+    solves = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    first_blood_user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    first_blood_at = db.Column(db.DateTime)
+
+    first_blood_user = db.relationship('User')
+
+    def __repr__(self):
+        return f'<ChallengeStats {self.challenge_id}: {self.solves}/{self.attempts}>'
+
+class ScoreEvent(db.Model):
+    # Append-only score history for the scoreboard chart, see ScoreTimeline
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    at = db.Column(db.DateTime, nullable=False)
+    score = db.Column(db.Integer, nullable=False)  # Total after the change
+
+    __table_args__ = (
+        # Covers the chart query: one user's points in order without reading the table
+        db.Index('ix_score_event_user_at', 'user_id', 'at', 'score'),
+    )
+
+    def __repr__(self):
+        return f'<ScoreEvent {self.user_id}={self.score} at {self.at}>'
+
+class CacheVersion(db.Model):
+    # Shared invalidation counters, bumped in the same transaction as the change
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
@@ -0,0 +1,72 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised instead of queueing when too many hashes are already waiting."""
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a small bounded pool.
+
+    werkzeug's hashes spend their time in hashlib, which releases the GIL,
+    so PASSWORD_HASH_WORKERS threads cap how many cores a burst of logins
+    can occupy while the rest of the worker's threads keep serving pages.
+    At most PASSWORD_HASH_QUEUE more requests may wait for a slot; beyond
+    that PasswordHasherBusy is raised straight away so the caller can answer
+    503 rather than tying up another thread. A hash that isn't done within
+    PASSWORD_HASH_TIMEOUT raises PasswordHasherBusy too. The pool is
+    created lazily in each process.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 2
+        self.max_pending = 32
+        self.timeout = 10.0
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_QUEUE', self.max_pending)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        app.extensions['password_hasher'] = self
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hasher')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # Still queued behind slower hashes: give up its slot and let the caller answer 503
+            future.cancel()
+            raise PasswordHasherBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
@@ -0,0 +1,145 @@
+"""Retention for incorrect submissions.
+
+Wrong guesses are only needed in bulk once they are old. compact() moves
+incorrect attempts older than a cutoff out of the submission table, in id
+order and in batches. Each batch is first appended to a gzip JSONL archive
+and then folded into submission_rollup as attempts per user, challenge and
+hour. Finally the rows are deleted, and the batch is committed before the
+next one starts. The dashboard counters already include these attempts and
+rebuild() adds the rollups back, so the admin numbers don't change.
+
+Correct submissions are never touched: scores, first bloods and the score
+timeline are all derived from them.
+
+A batch is written to the archive before its transaction commits. A crash
+in between can therefore leave rows both in the archive and in the table,
+and the next run archives them again. Readers of the archives should
+de-duplicate on id.
+"""
+import gzip
+import json
+import os
+from collections import Counter, namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, delete, insert, select, update
+
+CompactResult = namedtuple('CompactResult', ['rows', 'rollups', 'archive'])
+
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _archive_row(row):
+    return json.dumps({
+        'id': row.id,
+        'user_id': row.user_id,
+        'challenge_id': row.challenge_id,
+        'submitted_flag': row.submitted_flag,
+        'submitted_at': row.submitted_at.isoformat(),
+    }, separators=(',', ':')) + '\n'
+
+
+def _add_rollups(session, counts):
+    """Add {(user_id, challenge_id, hour): attempts} to the rollup table."""
+    from models import SubmissionRollup
+
+    rollup = SubmissionRollup.__table__
+    for (user_id, challenge_id, hour), attempts in counts.items():
+        key = and_(rollup.c.user_id == user_id, rollup.c.challenge_id == challenge_id, rollup.c.hour == hour)
+        result = session.execute(update(rollup).where(key).values(attempts=rollup.c.attempts + attempts))
+        if result.rowcount == 0:
+            session.execute(insert(rollup).values(
+                user_id=user_id, challenge_id=challenge_id, hour=hour, attempts=attempts
+            ))
+
+
+def compact(cutoff, archive_dir, batch_size=5000, dry_run=False, progress=None):
+    """Archive and roll up incorrect submissions made before cutoff. Returns a CompactResult.
+
+    progress, if given, is called with the number of rows after each batch.
+    """
+    from extensions import db
+    from models import Submission
+
+    submission = Submission.__table__
+    pending = select(
+        submission.c.id, submission.c.user_id, submission.c.challenge_id,
+        submission.c.submitted_flag, submission.c.submitted_at
+    ).where(
+        submission.c.is_correct == False, submission.c.submitted_at < cutoff
+    ).order_by(submission.c.id).limit(batch_size)
+
+    if dry_run:
+        rows = db.session.execute(
+            select(submission.c.user_id, submission.c.challenge_id, submission.c.submitted_at)
+            .where(submission.c.is_correct == False, submission.c.submitted_at < cutoff)
+        )
+        keys = Counter((row.user_id, row.challenge_id, hour_of(row.submitted_at)) for row in rows)
+        return CompactResult(sum(keys.values()), len(keys), None)
+
+    rows = db.session.execute(pending).all()
+    if not rows:
+        return CompactResult(0, 0, None)
+    os.makedirs(archive_dir, exist_ok=True)
+    # The first id keeps two runs in the same second from sharing a file
+    archive = os.path.join(archive_dir, f'submissions-{datetime.utcnow():%Y%m%dT%H%M%S}-{rows[0].id}.jsonl.gz')
+    total, keys = 0, set()
+    with gzip.open(archive, 'xt', encoding='utf-8') as out:
+        while rows:
+            counts = Counter((row.user_id, row.challenge_id, hour_of(row.submitted_at)) for row in rows)
+            out.writelines(_archive_row(row) for row in rows)
+            out.flush()
+            try:
+                _add_rollups(db.session, counts)
+                ids = [row.id for row in rows]
+                for start in range(0, len(ids), 500):
+                    db.session.execute(delete(submission).where(submission.c.id.in_(ids[start:start + 500])))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            total += len(rows)
+            keys.update(counts)
+            if progress is not None:
+                progress(len(rows))
+            rows = db.session.execute(pending.where(submission.c.id > rows[-1].id)).all()
+    return CompactResult(total, len(keys), archive)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    value = value.isoformat() if isinstance(value, datetime) else str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def export_rows(batch_size=1000):
+    """Yield every submission as a CSV-ready tuple, oldest first, batch_size rows per query.
+
+    Batches are read by id, and the session is released between them. A
+    long download therefore never holds a pooled connection or a read
+    snapshot, and never has more than one batch in memory.
+    """
+    from extensions import db
+    from models import User, Challenge, Submission
+
+    yield ('id', 'user_id', 'username', 'challenge_id', 'challenge', 'submitted_flag', 'is_correct', 'submitted_at')
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            Submission.id, Submission.user_id, User.username, Submission.challenge_id, Challenge.title,
+            Submission.submitted_flag, Submission.is_correct, Submission.submitted_at
+        ).outerjoin(User, User.id == Submission.user_id).outerjoin(
+            Challenge, Challenge.id == Submission.challenge_id
+        ).filter(Submission.id > last_id).order_by(Submission.id).limit(batch_size).all()
+        db.session.close()
+        if not rows:
+            return
+        for row in rows:
+            yield tuple(_cell(value) for value in row)
+        last_id = rows[-1].id
@@ -1,22 +1,70 @@
-from flask import request, jsonify, render_template, redirect, url_for, session, flash
+from flask import request, jsonify, render_template, redirect, url_for, session, flash, abort, make_response, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from extensions import db
-from models import User, Challenge, Submission
+from extensions import db, leaderboard, scoreboard_feed, catalog, media_store, derivatives, submissions, dashboard_stats, metrics, user_cache, score_timeline
+from media_store import MediaTooLarge
+from password_hasher import PasswordHasherBusy
+from models import User, Challenge, Submission, SubmissionRollup
+from submissions import ALREADY_SOLVED, CORRECT
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from functools import wraps
+import csv
+import hashlib
+import hmac
+import io
 import re
-import os
+import retention
+import scoring
+from datetime import datetime, timezone
 from sqlalchemy import func
 
 # Login manager setup will be done in the init_routes function
 
-UPLOAD_FOLDER = 'static/uploads/challenges'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp', 'svg', 'pdf'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_media_uploads():
+    """Store the request's media_files uploads. Returns (references, error message)."""
+    references = []
+    for file in request.files.getlist('media_files'):
+        if not file:
+            continue
+        if not allowed_file(file.filename):
+            return references, f'Invalid file type for {file.filename}. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'
+        try:
+            references.append(media_store.save(file))
+        except MediaTooLarge as e:
+            return references, str(e)
+    return references, None
+
+def dynamic_scoring_form(points):
+    """Read minimum_points and decay from the form. Returns ((minimum_points, decay), error message)."""
+    minimum_points = request.form.get('minimum_points', '').strip()
+    decay = request.form.get('decay', '').strip()
+    if not minimum_points and not decay:
+        return (None, None), None
+    try:
+        minimum_points, decay = int(minimum_points), int(decay)
+    except ValueError:
+        return None, 'Dynamic scoring needs both a minimum points value and a decay'
+    if not 0 <= minimum_points <= points or decay < 1:
+        return None, 'Minimum points must be between 0 and the points value, and decay at least 1'
+    return (minimum_points, decay), None
+
+def solver_ids(challenge_id):
+    return [user_id for user_id, in db.session.query(Submission.user_id).filter_by(
+        challenge_id=challenge_id, is_correct=True
+    )]
+
+def publish_score(user, result):
+    """Put a solve's new scores on this worker's leaderboard and live feed."""
+    if user.role != 'admin':
+        leaderboard.update(user.id, user.username, result.score)
+        scoreboard_feed.publish(user.id, user.username, result.score, leaderboard.rank_of(user.id))
+    if result.rescored:
+        scoreboard_feed.refresh_users(result.rescored)
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -26,6 +74,47 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def server_busy(template):
+    flash('The server is busy signing other players in. Please try again in a few seconds.', 'danger')
+    response = make_response(render_template(template), 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
+def cached_response(etag, last_modified, render):
+    """Answer 304 when the client already holds this representation, else render it.
+
+    The response is private and must be revalidated on every use, so
+    per-user pages can be cached without leaking between accounts. Pass
+    last_modified=None when there is no meaningful modification time;
+    only the ETag is used then.
+    """
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    # A pending flash message changes the page, so it always has to be rendered
+    if not session.get('_flashes'):
+        if request.if_none_match:
+            if request.if_none_match.contains(etag):
+                return _not_modified(etag, last_modified)
+        elif request.if_modified_since and last_modified is not None and last_modified <= request.if_modified_since:
+            return _not_modified(etag, last_modified)
+    response = make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        # Werkzeug turns None into the current time
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(etag, last_modified):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 def init_routes(app):
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -34,12 +123,16 @@ def init_routes(app):
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
 
     @app.route('/')
     def index():
         return render_template('index.html')
 
+    @app.route('/media/<path:filename>')
+    def media(filename):
+        return media_store.send(filename)
+
     @app.route('/register', methods=['GET', 'POST'])
     def register():
         if current_user.is_authenticated:
@@ -78,15 +171,23 @@ def init_routes(app):
 
             # Create new user
             user = User(username=username, email=email)
-            user.set_password(password)
+            # Don't hold a pooled connection while waiting for the hasher
+            db.session.close()
+            try:
+                user.set_password(password)
+            except PasswordHasherBusy:
+                return server_busy('register.html')
             
             # First user is admin
-            if User.query.count() == 0:
+            if db.session.query(User.id).first() is None:
                 user.role = 'admin'
                 
             db.session.add(user)
             try:
+                dashboard_stats.user_registered()
                 db.session.commit()
+                if user.role != 'admin':
+                    leaderboard.update(user.id, user.username, user.score)
                 flash('Registration successful! Please log in.', 'success')
                 return redirect(url_for('login'))
             except Exception as e:
@@ -110,7 +211,12 @@ def init_routes(app):
                 return redirect(url_for('login'))
 
             user = User.query.filter(func.lower(User.username) == func.lower(username)).first()
-            if user and user.check_password(password):
+            db.session.close()
+            try:
+                valid = user is not None and user.check_password(password)
+            except PasswordHasherBusy:
+                return server_busy('login.html')
+            if valid:
                 login_user(user)
                 next_page = request.args.get('next')
                 return redirect(next_page or url_for('challenges'))
@@ -128,88 +234,153 @@ def init_routes(app):
     @app.route('/challenges')
     @login_required
     def challenges():
-        challenges = Challenge.query.filter_by(is_active=True).all()
-        return render_template('challenges.html', challenges=challenges)
+        # The catalog and the player's solved set are both cached, so the grid costs no per-card queries
+        version, _ = catalog.version()
+        solved = submissions.solved(current_user.id)
+        solved_digest = hashlib.sha1(','.join(map(str, sorted(solved))).encode('ascii')).hexdigest()[:16]
+        etag = f'catalog-{version}-{current_user.id}-{current_user.role}-{solved_digest}'
+        # A solve changes the page without touching the catalog's updated_at, so it is validated by
+        # the ETag alone and sent without Last-Modified
+        return cached_response(etag, None, lambda: render_template(
+            'challenges.html', challenges=catalog.active(), solved=solved, progress=catalog.progress(solved)
+        ))
 
     @app.route('/challenge/<int:challenge_id>', methods=['GET', 'POST'])
     @login_required
     def challenge(challenge_id):
-        challenge = Challenge.query.get_or_404(challenge_id)
         if request.method == 'POST':
             submitted_flag = request.form.get('flag', '').strip()
             if not submitted_flag:
                 flash('Please enter a flag', 'danger')
                 return redirect(url_for('challenge', challenge_id=challenge_id))
-                
-            # Check if already solved
-            existing = Submission.query.filter_by(
-                user_id=current_user.id, 
-                challenge_id=challenge_id, 
-                is_correct=True
-            ).first()
-            
-            if existing:
-                flash('You have already solved this challenge', 'info')
-                return redirect(url_for('challenge', challenge_id=challenge_id))
 
-            is_correct = submitted_flag == challenge.flag
-            submission = Submission(
-                user_id=current_user.id,
-                challenge_id=challenge_id,
-                submitted_flag=submitted_flag,
-                is_correct=is_correct
-            )
-            db.session.add(submission)
+            result = submissions.submit(current_user, challenge_id, submitted_flag)
+            if result is None:
+                abort(404)
 
-            if is_correct:
-                current_user.score += challenge.points
+            if result.status == ALREADY_SOLVED:
+                flash('You have already solved this challenge', 'info')
+            elif result.status == CORRECT:
+                publish_score(current_user, result)
                 flash('Correct flag! Points added to your score.', 'success')
             else:
                 flash('Incorrect flag. Try again.', 'danger')
-
-            db.session.commit()
             return redirect(url_for('challenge', challenge_id=challenge_id))
 
+        challenge = Challenge.query.get_or_404(challenge_id)
         return render_template('challenge.html', challenge=challenge)
 
     @app.route('/scoreboard')
     @login_required
     def scoreboard():
         if current_user.role == 'admin':
-            # Admins see full leaderboard
-            users = User.query.filter(User.role != 'admin').order_by(User.score.desc()).all()
-            # Create list of dicts with rank
-            leaderboard = []
-            for idx, user in enumerate(users, start=1):
-                leaderboard.append({'rank': idx, 'user': user})
-            return render_template('scoreboard.html', users=leaderboard, is_admin=True)
+            # Admins see the full leaderboard, one page at a time
+            page = request.args.get('page', 1, type=int)
+            per_page = app.config['SCOREBOARD_PAGE_SIZE']
+            leaderboard_page, total = leaderboard.page(page, per_page)
+            pages = max((total + per_page - 1) // per_page, 1)
+            return render_template('scoreboard.html', users=leaderboard_page, is_admin=True,
+                                   page=min(max(page, 1), pages), pages=pages)
         else:
-            # Regular users see only their own entry with rank
-            all_users = User.query.filter(User.role != 'admin').order_by(User.score.desc()).all()
-            # Find the current user's rank
-            user_rank = None
-            for idx, user in enumerate(all_users, start=1):
-                if user.id == current_user.id:
-                    user_rank = idx
-                    break
-            # If user not found (shouldn't happen), default to last
-            if user_rank is None:
-                user_rank = len(all_users) + 1
-            user_data = [{'rank': user_rank, 'user': current_user}]
+            # Regular users see their own entry with rank (plus optional neighbours)
+            user_data = leaderboard.around(current_user, app.config['SCOREBOARD_AROUND_ME'])
             return render_template('scoreboard.html', users=user_data, is_admin=False)
 
+    @app.route('/scoreboard/timeline')
+    @login_required
+    def scoreboard_timeline():
+        # Same people as the scoreboard page: the leaders for admins, a player's own row otherwise
+        if current_user.role == 'admin':
+            top = request.args.get('top', score_timeline.max_users, type=int)
+            entries, _ = leaderboard.page(1, min(max(top, 1), score_timeline.max_users))
+        else:
+            entries = leaderboard.around(current_user, app.config['SCOREBOARD_AROUND_ME'])
+        bucket = min(max(request.args.get('bucket', score_timeline.bucket_seconds, type=int), 60), 86400)
+        latest_id, latest_at = score_timeline.latest()
+        etag = f'timeline-{latest_id}-{bucket}-' + '.'.join(str(entry.user_id) for entry in entries)
+
+        def render():
+            return jsonify({
+                'bucket': bucket,
+                'series': [
+                    {'user_id': series.user_id, 'username': series.username, 'points': series.points}
+                    for series in score_timeline.series(entries, bucket)
+                ],
+            })
+        return cached_response(etag, latest_at or datetime(1970, 1, 1), render)
+
+    @app.route('/scoreboard/stream')
+    @login_required
+    def scoreboard_stream():
+        subscriber = scoreboard_feed.subscribe()
+        if subscriber is None:
+            # Every stream holds a thread; past the cap the page polls /scoreboard/live instead
+            return Response('Too many live scoreboard connections', 503, mimetype='text/plain',
+                            headers={'Retry-After': '30'})
+        stream = scoreboard_feed.stream(subscriber, current_user.id, current_user.role == 'admin',
+                                        request.headers.get('Last-Event-ID'))
+        response = Response(stream_with_context(stream), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # The generator's own cleanup doesn't run if the client leaves before the first chunk
+        response.call_on_close(lambda: scoreboard_feed.unsubscribe(subscriber))
+        return response
+
+    @app.route('/scoreboard/live')
+    @login_required
+    def scoreboard_live():
+        body = scoreboard_feed.poll(current_user.id, current_user.role == 'admin')
+        etag = 'live-' + hashlib.sha1(repr(body).encode('utf-8')).hexdigest()
+        return cached_response(etag, None, lambda: jsonify(body))
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        # Admins, or a scraper presenting METRICS_TOKEN
+        allowed = current_user.is_authenticated and current_user.role == 'admin'
+        token = app.config.get('METRICS_TOKEN')
+        if not allowed and token:
+            # compare_digest only takes ASCII strings, and headers arrive decoded as latin-1
+            try:
+                allowed = hmac.compare_digest(request.headers.get('Authorization', '').encode('ascii'),
+                                              f'Bearer {token}'.encode('utf-8'))
+            except UnicodeEncodeError:
+                allowed = False
+        if not allowed:
+            abort(403)
+        return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8',
+                        headers={'Cache-Control': 'no-store'})
+
     @app.route('/admin')
     @admin_required
     def admin():
+        totals = dashboard_stats.totals()
         stats = {
-            'total_users': User.query.count(),
-            'total_challenges': Challenge.query.count(),
-            'total_submissions': Submission.query.count(),
-            'solved_challenges': Submission.query.filter_by(is_correct=True).count()
+            'total_users': totals['users'],
+            'total_challenges': totals['challenges'],
+            'total_submissions': totals['submissions'],
+            'solved_challenges': totals['solves'],
+            'solve_rate': totals['solves'] / totals['submissions'] if totals['submissions'] else 0
         }
-        challenges = Challenge.query.all()
+        challenges = dashboard_stats.challenges()
         return render_template('admin.html', challenges=challenges, stats=stats)
 
+    @app.route('/admin/submissions.csv')
+    @admin_required
+    def export_submissions():
+        """Stream every stored submission as CSV, a batch at a time."""
+        def stream():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in retention.export_rows():
+                writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        filename = f'submissions-{datetime.utcnow():%Y%m%dT%H%M%S}.csv'
+        return Response(stream_with_context(stream()), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}',
+                                 'Cache-Control': 'no-store'})
+
     @app.route('/admin/challenge/add', methods=['GET', 'POST'])
     @admin_required
     def add_challenge():
@@ -227,26 +398,20 @@ def init_routes(app):
             except (ValueError, TypeError):
                 flash('Invalid points value', 'danger')
                 return redirect(url_for('add_challenge'))
+            dynamic, error = dynamic_scoring_form(points)
+            if error:
+                flash(error, 'danger')
+                return redirect(url_for('add_challenge'))
 
             if not all([title, description, category, flag]):
                 flash('All fields are required', 'danger')
                 return redirect(url_for('add_challenge'))
 
             # Handle file uploads
-            uploaded_files = []
-            if 'media_files' in request.files:
-                files = request.files.getlist('media_files')
-                for file in files:
-                    if file and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        # Add challenge ID prefix to avoid conflicts
-                        unique_filename = f"temp_{filename}"
-                        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-                        file.save(file_path)
-                        uploaded_files.append(unique_filename)
-                    elif file:
-                        flash(f'Invalid file type for {file.filename}. Allowed: {", ".join(ALLOWED_EXTENSIONS)}', 'danger')
-                        return redirect(url_for('add_challenge'))
+            uploaded_files, error = save_media_uploads()
+            if error:
+                flash(error, 'danger')
+                return redirect(url_for('add_challenge'))
 
             challenge = Challenge(
                 title=title,
@@ -254,31 +419,24 @@ def init_routes(app):
                 category=category,
                 flag=flag,
                 points=points,
+                minimum_points=dynamic[0],
+                decay=dynamic[1],
                 crypto_type=crypto_type
             )
             challenge.set_media_files(uploaded_files)
 
             db.session.add(challenge)
+            catalog.bump()
             try:
+                db.session.flush()
+                dashboard_stats.challenge_added(challenge.id)
                 db.session.commit()
-                # Rename files with challenge ID
-                for i, filename in enumerate(uploaded_files):
-                    old_path = os.path.join(UPLOAD_FOLDER, filename)
-                    new_filename = f"{challenge.id}_{filename.replace('temp_', '')}"
-                    new_path = os.path.join(UPLOAD_FOLDER, new_filename)
-                    os.rename(old_path, new_path)
-                    uploaded_files[i] = new_filename
-                challenge.set_media_files(uploaded_files)
-                db.session.commit()
+                for media in uploaded_files:
+                    derivatives.submit(media)
                 flash('Challenge added successfully', 'success')
                 return redirect(url_for('admin'))
             except Exception as e:
                 db.session.rollback()
-                # Clean up uploaded files on error
-                for filename in uploaded_files:
-                    file_path = os.path.join(UPLOAD_FOLDER, filename)
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
                 flash('Error adding challenge. Please try again.', 'danger')
                 app.logger.error(f'Error adding challenge: {str(e)}')
 
@@ -289,6 +447,7 @@ def init_routes(app):
     def edit_challenge(challenge_id):
         challenge = Challenge.query.get_or_404(challenge_id)
         if request.method == 'POST':
+            old_value = challenge.value
             challenge.title = request.form.get('title', '').strip()
             challenge.description = request.form.get('description', '').strip()
             challenge.category = request.form.get('category', '').strip()
@@ -302,29 +461,35 @@ def init_routes(app):
             except (ValueError, TypeError):
                 flash('Invalid points value', 'danger')
                 return redirect(url_for('edit_challenge', challenge_id=challenge_id))
+            dynamic, error = dynamic_scoring_form(challenge.points)
+            if error:
+                flash(error, 'danger')
+                return redirect(url_for('edit_challenge', challenge_id=challenge_id))
+            challenge.minimum_points, challenge.decay = dynamic
 
             if not all([challenge.title, challenge.description, challenge.category, challenge.flag]):
                 flash('All fields are required', 'danger')
                 return redirect(url_for('edit_challenge', challenge_id=challenge_id))
 
             # Handle file uploads
-            current_files = challenge.get_media_files()
-            if 'media_files' in request.files:
-                files = request.files.getlist('media_files')
-                for file in files:
-                    if file and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        unique_filename = f"{challenge.id}_{filename}"
-                        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-                        file.save(file_path)
-                        current_files.append(unique_filename)
-                    elif file:
-                        flash(f'Invalid file type for {file.filename}. Allowed: {", ".join(ALLOWED_EXTENSIONS)}', 'danger')
-                        return redirect(url_for('edit_challenge', challenge_id=challenge_id))
+            uploaded_files, error = save_media_uploads()
+            if error:
+                flash(error, 'danger')
+                return redirect(url_for('edit_challenge', challenge_id=challenge_id))
+            current_files = challenge.get_media_files() + uploaded_files
             challenge.set_media_files(current_files)
+            catalog.bump()
 
             try:
+                # Everyone who solved it holds the current value
+                new_value = challenge.value
+                scoring.revalue(challenge_id, old_value, new_value)
                 db.session.commit()
+                submissions.invalidate(challenge_id)
+                if new_value != old_value:
+                    scoreboard_feed.refresh_users(solver_ids(challenge_id))
+                for media in uploaded_files:
+                    derivatives.submit(media)
                 flash('Challenge updated successfully', 'success')
                 return redirect(url_for('admin'))
             except Exception as e:
@@ -339,10 +504,17 @@ def init_routes(app):
     def delete_challenge(challenge_id):
         challenge = Challenge.query.get_or_404(challenge_id)
         try:
-            # Delete related submissions first
+            # Take it off its solvers' scores, then delete related submissions
+            rescored = solver_ids(challenge_id)
+            scoring.revalue(challenge_id, challenge.value, 0)
+            dashboard_stats.challenge_deleted(challenge_id)
             Submission.query.filter_by(challenge_id=challenge_id).delete()
+            SubmissionRollup.query.filter_by(challenge_id=challenge_id).delete()
             db.session.delete(challenge)
+            catalog.bump()
             db.session.commit()
+            submissions.invalidate()
+            scoreboard_feed.refresh_users(rescored)
             flash('Challenge deleted successfully', 'success')
         except Exception as e:
             db.session.rollback()
@@ -0,0 +1,137 @@
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, delete, insert, literal, select
+
+TimelineSeries = namedtuple('TimelineSeries', ['user_id', 'username', 'points'])
+
+
+class ScoreTimeline:
+    """Append-only history of player scores behind the scoreboard chart.
+
+    Each score_event row is a player's total after a change. Every path that
+    moves a score calls record() on the session it is about to commit, which
+    appends the new totals straight from the user table with one
+    INSERT ... SELECT, so the history can't drift from the scores. Drawing
+    the leaders reads only their rows off the covering (user_id, at, score)
+    index, however many submissions there are; points are bucketed as they
+    are read. rebuild() replays the submission table into a fresh history.
+    """
+
+    def __init__(self, app=None):
+        self.bucket_seconds = 300
+        self.max_users = 20
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.bucket_seconds = app.config.get('SCORE_TIMELINE_BUCKET_SECONDS', self.bucket_seconds)
+        self.max_users = app.config.get('SCORE_TIMELINE_USERS', self.max_users)
+        app.extensions['score_timeline'] = self
+
+    @staticmethod
+    def _session(conn):
+        from extensions import db
+
+        return conn if conn is not None else db.session
+
+    def record(self, user_ids, at=None, conn=None):
+        """Append the current score of user_ids (a list or a subquery of ids); admins are skipped."""
+        from models import User, ScoreEvent
+
+        if isinstance(user_ids, (list, tuple, set)) and not user_ids:
+            return
+        current = select(User.id, literal(at or datetime.utcnow(), DateTime()), User.score).where(
+            User.id.in_(user_ids), User.role != 'admin'
+        )
+        self._session(conn).execute(
+            insert(ScoreEvent.__table__).from_select(['user_id', 'at', 'score'], current)
+        )
+
+    def latest(self):
+        """Return (id, at) of the newest event, or (0, None) for an empty history."""
+        from extensions import db
+        from models import ScoreEvent
+
+        row = db.session.query(ScoreEvent.id, ScoreEvent.at).order_by(ScoreEvent.id.desc()).first()
+        return tuple(row) if row else (0, None)
+
+    def series(self, entries, bucket_seconds=None):
+        """Bucketed score history for leaderboard entries, one TimelineSeries each.
+
+        points is a list of (bucket start as a Unix timestamp, score at the
+        end of that bucket), oldest first, with only the buckets where the
+        score changed.
+        """
+        from extensions import db
+        from models import ScoreEvent
+
+        bucket = bucket_seconds or self.bucket_seconds
+        points = {entry.user_id: [] for entry in entries}
+        if points:
+            rows = db.session.query(ScoreEvent.user_id, ScoreEvent.at, ScoreEvent.score).filter(
+                ScoreEvent.user_id.in_(list(points))
+            ).order_by(ScoreEvent.user_id, ScoreEvent.at)
+            for user_id, at, score in rows:
+                start = int(at.replace(tzinfo=timezone.utc).timestamp()) // bucket * bucket
+                line = points[user_id]
+                if line and line[-1][0] == start:
+                    line[-1] = (start, score)
+                else:
+                    line.append((start, score))
+        return [TimelineSeries(entry.user_id, entry.username, points[entry.user_id]) for entry in entries]
+
+    def rebuild(self, conn=None):
+        """Replace the history with a replay of every correct submission. Returns the number of events.
+
+        Dynamic challenges are replayed with their current settings. Users
+        whose replayed total differs from their score, because a challenge
+        was edited or deleted along the way, get a final event with their
+        current score.
+        """
+        from models import User, Challenge, Submission, ScoreEvent
+        from scoring import challenge_value
+
+        session = self._session(conn)
+        users = {row.id: row for row in session.execute(select(User.id, User.role, User.score))}
+        challenges = {row.id: row for row in session.execute(
+            select(Challenge.id, Challenge.points, Challenge.minimum_points, Challenge.decay)
+        )}
+        solves = session.execute(
+            select(Submission.user_id, Submission.challenge_id, Submission.submitted_at)
+            .where(Submission.is_correct == True)
+            .order_by(Submission.submitted_at, Submission.id)
+        )
+
+        counts, solvers, scores, events = Counter(), defaultdict(list), Counter(), []
+        for user_id, challenge_id, at in solves:
+            challenge, user = challenges.get(challenge_id), users.get(user_id)
+            if challenge is None or user is None:
+                continue
+            counted = user.role != 'admin'
+            if counted:
+                counts[challenge_id] += 1
+            value = challenge_value(challenge.points, challenge.minimum_points, challenge.decay, counts[challenge_id])
+            previous = challenge_value(
+                challenge.points, challenge.minimum_points, challenge.decay, counts[challenge_id] - 1
+            ) if counted else value
+            if value != previous:
+                for solver in solvers[challenge_id]:
+                    scores[solver] += value - previous
+                    if users[solver].role != 'admin':
+                        events.append({'user_id': solver, 'at': at, 'score': scores[solver]})
+            solvers[challenge_id].append(user_id)
+            scores[user_id] += value
+            if counted:
+                events.append({'user_id': user_id, 'at': at, 'score': scores[user_id]})
+        now = datetime.utcnow()
+        events.extend(
+            {'user_id': user.id, 'at': now, 'score': user.score or 0}
+            for user in users.values()
+            if user.role != 'admin' and (user.score or 0) != scores[user.id]
+        )
+
+        session.execute(delete(ScoreEvent.__table__))
+        for start in range(0, len(events), 1000):
+            session.execute(insert(ScoreEvent.__table__), events[start:start + 1000])
+        return len(events)
@@ -0,0 +1,133 @@
+"""Dynamic (decaying) challenge values.
+
+A challenge with minimum_points and decay set is worth points to start
+with and loses value as it is solved. The value follows a parabola that
+reaches minimum_points on solve number decay + 1 and stays there after
+that. Every solver holds the current value, including the early ones, so
+a solve that lowers the value also lowers everyone who solved it before.
+
+challenge.solve_count holds the number of non-admin solves of every
+challenge. A solve bumps it and, if that changes the value, moves every
+earlier solver by the difference in value with one relative UPDATE, in
+the transaction that records the solve. rebuild() recomputes every count
+and score from the submission table in one pass, for audits and after
+bulk changes.
+"""
+import math
+from collections import Counter, namedtuple
+
+from sqlalchemy import bindparam, select, update
+
+ScoreChange = namedtuple('ScoreChange', ['user_id', 'username', 'old', 'new'])
+
+
+def challenge_value(points, minimum_points, decay, solve_count):
+    """Value of a challenge after solve_count solves."""
+    if minimum_points is None or not decay:
+        return points
+    solves = max(solve_count - 1, 0)
+    value = math.ceil((minimum_points - points) / decay ** 2 * solves ** 2 + points)
+    return max(value, minimum_points)
+
+
+def _solvers(challenge_id, exclude=None):
+    from models import Submission
+
+    solvers = select(Submission.user_id).where(Submission.challenge_id == challenge_id, Submission.is_correct == True)
+    return solvers if exclude is None else solvers.where(Submission.user_id != exclude)
+
+
+def record_solve(challenge_id, user_id, key, counted=True):
+    """Record a solve of a challenge worth key.points; call before committing it.
+
+    Returns (points for this solve, ids of earlier solvers whose score
+    moved). Admin solves pass counted=False and don't decay the value.
+    """
+    from extensions import db, catalog
+    from models import Challenge
+
+    challenge = Challenge.__table__
+    if counted:
+        db.session.execute(
+            update(challenge).where(challenge.c.id == challenge_id).values(solve_count=challenge.c.solve_count + 1)
+        )
+    if key.decay is None:
+        return key.points, ()
+    solve_count = db.session.execute(select(challenge.c.solve_count).where(challenge.c.id == challenge_id)).scalar()
+    value = challenge_value(key.points, key.minimum_points, key.decay, solve_count)
+    previous = challenge_value(key.points, key.minimum_points, key.decay, solve_count - 1) if counted else value
+    if value == previous:
+        return value, ()
+    rescored = [uid for uid, in db.session.execute(_solvers(challenge_id)) if uid != user_id]
+    revalue(challenge_id, previous, value, exclude=user_id)
+    catalog.bump()
+    return value, rescored
+
+
+def revalue(challenge_id, old_value, new_value, exclude=None):
+    """Move every solver of a challenge from old_value to new_value in one UPDATE.
+
+    Used when a solve decays the value and when an admin edits or deletes
+    the challenge. Commits with the caller's transaction.
+    """
+    from extensions import db, score_timeline
+    from models import User
+
+    if old_value == new_value:
+        return
+    db.session.execute(
+        update(User.__table__)
+        .where(User.id.in_(_solvers(challenge_id, exclude)))
+        .values(score=User.score + (new_value - old_value))
+    )
+    score_timeline.record(_solvers(challenge_id, exclude))
+
+
+def rebuild(dry_run=False):
+    """Recompute solve counts and every score from the submission table.
+
+    Returns (list of ScoreChange, number of challenges whose solve count
+    was wrong). Nothing is written with dry_run.
+    """
+    from extensions import db, catalog, score_timeline
+    from models import Challenge, Submission, User
+
+    roles = dict(db.session.query(User.id, User.role))
+    solves = db.session.query(Submission.user_id, Submission.challenge_id).filter(Submission.is_correct == True).all()
+    counts = Counter(challenge_id for user_id, challenge_id in solves if roles.get(user_id) != 'admin')
+
+    values, miscounted = {}, []
+    for challenge in db.session.query(Challenge.id, Challenge.points, Challenge.minimum_points,
+                                      Challenge.decay, Challenge.solve_count):
+        values[challenge.id] = challenge_value(
+            challenge.points, challenge.minimum_points, challenge.decay, counts[challenge.id]
+        )
+        if challenge.solve_count != counts[challenge.id]:
+            miscounted.append({'_id': challenge.id, 'solve_count': counts[challenge.id]})
+
+    scores = Counter()
+    for user_id, challenge_id in solves:
+        scores[user_id] += values.get(challenge_id, 0)
+    changes = [
+        ScoreChange(user_id, username, score or 0, scores[user_id])
+        for user_id, username, score in db.session.query(User.id, User.username, User.score)
+        if (score or 0) != scores[user_id]
+    ]
+    if dry_run or not (changes or miscounted):
+        return changes, len(miscounted)
+
+    user, challenge = User.__table__, Challenge.__table__
+    if changes:
+        db.session.execute(
+            update(user).where(user.c.id == bindparam('_id')).values(score=bindparam('score')),
+            [{'_id': change.user_id, 'score': change.new} for change in changes]
+        )
+        score_timeline.record([change.user_id for change in changes])
+    if miscounted:
+        db.session.execute(
+            update(challenge).where(challenge.c.id == bindparam('_id')).values(solve_count=bindparam('solve_count')),
+            miscounted
+        )
+        catalog.bump()
+    db.session.commit()
+    return changes, len(miscounted)
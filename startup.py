@@ -0,0 +1,82 @@
+"""What create_app() does once the extensions are set up.
+
+Development startup checks the whole schema: db.create_all() reflects
+every table and upgrade() applies pending migrations. With
+PRODUCTION_STARTUP that becomes a single read of schema_version. The full
+check only runs when the recorded version is behind the code, which is
+the case once per deploy for whichever process starts first. So a change
+that adds a table or column must also add a migration, as every schema
+change here does.
+
+Compiled templates are written to a Jinja bytecode cache in
+TEMPLATE_CACHE_DIR (instance/jinja-cache by default), so a new process
+loads the compiled code instead of parsing and compiling every template
+again. Jinja keys each cache entry on a checksum of the template source,
+so edited templates are compiled again automatically. In production mode
+every template is loaded and the ORM mappers are configured at startup.
+Under gunicorn --preload that happens once in the master, and the workers
+share the result after fork.
+"""
+import logging
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import configure_mappers
+
+logger = logging.getLogger(__name__)
+
+
+def init_template_cache(app):
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja-cache')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        logger.warning('Template cache directory %s is not writable; compiling templates in memory', cache_dir)
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def precompile_templates(app):
+    """Load every template into the environment's cache. Returns how many were loaded."""
+    names = app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def schema_is_current():
+    from migrations import current_version, latest_version
+
+    try:
+        return current_version() >= latest_version()
+    except (OperationalError, ProgrammingError):
+        return False  # No schema_version table: a new database
+
+
+def prepare_database(app):
+    """Create missing tables and apply migrations, unless production mode finds them current."""
+    from extensions import db
+    from migrations import upgrade
+
+    if not (app.config.get('PRODUCTION_STARTUP') and schema_is_current()):
+        db.session.rollback()
+        db.create_all()
+        upgrade()
+    db.session.remove()
+    # Hand no open connections to workers forked from this process
+    db.engine.dispose()
+
+
+def start(app):
+    """Run the startup work inside an app context and log how long it took."""
+    started = time.perf_counter()
+    with app.app_context():
+        prepare_database(app)
+    templates = 0
+    if app.config.get('PRODUCTION_STARTUP'):
+        # Work every worker would otherwise repeat on its first requests
+        configure_mappers()
+        templates = precompile_templates(app)
+    logger.info('Started in %.3fs (%d templates precompiled)', time.perf_counter() - started, templates)
@@ -0,0 +1,88 @@
+// AIT CTF score timeline: draws /scoreboard/timeline as step lines in an SVG
+
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.querySelector('.score-timeline[data-url]');
+    if (!container) {
+        return;
+    }
+    const SVG = 'http://www.w3.org/2000/svg';
+    const COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+                    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'];
+    const WIDTH = 800, HEIGHT = 320, PAD = 40;
+
+    function element(name, attributes) {
+        const node = document.createElementNS(SVG, name);
+        Object.keys(attributes).forEach(function(key) { node.setAttribute(key, attributes[key]); });
+        return node;
+    }
+
+    function draw(data) {
+        container.innerHTML = '';
+        const series = data.series.filter(function(line) { return line.points.length; });
+        if (!series.length) {
+            container.textContent = 'No solves yet.';
+            return;
+        }
+        // Every line runs on to the end of the current bucket
+        const now = Math.floor(Date.now() / 1000 / data.bucket) * data.bucket + data.bucket;
+        let start = now, top = 1;
+        series.forEach(function(line) {
+            start = Math.min(start, line.points[0][0]);
+            line.points.forEach(function(point) { top = Math.max(top, point[1]); });
+        });
+        start -= data.bucket;
+        const x = function(t) { return PAD + (t - start) / (now - start) * (WIDTH - 2 * PAD); };
+        const y = function(score) { return HEIGHT - PAD - score / top * (HEIGHT - 2 * PAD); };
+
+        const svg = element('svg', {viewBox: '0 0 ' + WIDTH + ' ' + HEIGHT, preserveAspectRatio: 'none'});
+        svg.appendChild(element('line', {'class': 'axis', x1: PAD, y1: HEIGHT - PAD, x2: WIDTH - PAD, y2: HEIGHT - PAD}));
+        svg.appendChild(element('line', {'class': 'axis', x1: PAD, y1: PAD, x2: PAD, y2: HEIGHT - PAD}));
+        [[0, HEIGHT - PAD + 4], [top, PAD + 4]].forEach(function(label) {
+            const text = element('text', {x: PAD - 6, y: label[1], 'text-anchor': 'end'});
+            text.textContent = label[0];
+            svg.appendChild(text);
+        });
+        [[start, 'start'], [now, 'end']].forEach(function(label) {
+            const text = element('text', {x: x(label[0]), y: HEIGHT - PAD + 18, 'text-anchor': label[1]});
+            text.textContent = new Date(label[0] * 1000).toLocaleString();
+            svg.appendChild(text);
+        });
+
+        const legend = document.createElement('ul');
+        legend.className = 'score-timeline-legend';
+        series.forEach(function(line, i) {
+            const color = COLORS[i % COLORS.length];
+            let score = 0, path = [x(start) + ',' + y(0)];
+            line.points.forEach(function(point) {
+                path.push(x(point[0]) + ',' + y(score));
+                score = point[1];
+                path.push(x(point[0]) + ',' + y(score));
+            });
+            path.push(x(now) + ',' + y(score));
+            const polyline = element('polyline', {points: path.join(' '), fill: 'none', stroke: color, 'stroke-width': 2});
+            const title = element('title', {});
+            title.textContent = line.username + ': ' + score;
+            polyline.appendChild(title);
+            svg.appendChild(polyline);
+
+            const item = document.createElement('li');
+            const swatch = document.createElement('span');
+            swatch.style.backgroundColor = color;
+            item.appendChild(swatch);
+            item.appendChild(document.createTextNode(line.username + ' (' + score + ')'));
+            legend.appendChild(item);
+        });
+        container.appendChild(svg);
+        container.appendChild(legend);
+    }
+
+    function refresh() {
+        // The endpoint sends an ETag, so unchanged history costs a 304
+        fetch(container.dataset.url, {credentials: 'same-origin', cache: 'no-cache'})
+            .then(function(response) { return response.ok ? response.json() : null; })
+            .then(function(data) { if (data) { draw(data); } });
+    }
+
+    refresh();
+    setInterval(refresh, 60000);
+});
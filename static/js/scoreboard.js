@@ -0,0 +1,106 @@
+// AIT CTF live scoreboard: applies events from /scoreboard/stream
+
+document.addEventListener('DOMContentLoaded', function() {
+    const table = document.querySelector('.scoreboard-table[data-stream-url]');
+    if (!table || !window.EventSource) {
+        return;
+    }
+    const body = table.querySelector('tbody');
+    const isAdmin = table.dataset.admin === 'true';
+    const limit = parseInt(table.dataset.limit, 10);
+    let entries = [];
+
+    function renderRow(row, entry) {
+        row.dataset.userId = entry.user_id;
+        row.innerHTML = '';
+        [entry.rank, entry.username, entry.score].forEach(function(value) {
+            const cell = document.createElement('td');
+            cell.textContent = value;
+            row.appendChild(cell);
+        });
+    }
+
+    function renderAll() {
+        body.innerHTML = '';
+        entries.forEach(function(entry) {
+            const row = document.createElement('tr');
+            renderRow(row, entry);
+            body.appendChild(row);
+        });
+    }
+
+    function applySnapshot(snapshot) {
+        if (isAdmin) {
+            entries = snapshot.entries;
+            renderAll();
+        } else {
+            snapshot.entries.forEach(applyOwnEntry);
+        }
+    }
+
+    function applyOwnEntry(entry) {
+        const row = body.querySelector('tr[data-user-id="' + entry.user_id + '"]');
+        if (row) {
+            renderRow(row, entry);
+        }
+    }
+
+    function applyDelta(delta) {
+        // Admins hold the first page and re-rank it locally
+        entries = entries.filter(function(entry) { return entry.user_id !== delta.user_id; });
+        entries.push(delta);
+        entries.sort(function(a, b) { return b.score - a.score || a.user_id - b.user_id; });
+        entries = entries.slice(0, limit);
+        entries.forEach(function(entry, i) { entry.rank = i + 1; });
+        renderAll();
+    }
+
+    const pollSeconds = parseFloat(table.dataset.pollSeconds);
+    let pollTimer = null;
+
+    function poll() {
+        fetch(table.dataset.pollUrl, {credentials: 'same-origin'}).then(function(response) {
+            return response.ok ? response.json().then(applySnapshot) : null;
+        }).catch(function() {});
+    }
+
+    function startPolling() {
+        if (pollTimer === null) {
+            poll();
+            pollTimer = setInterval(poll, pollSeconds * 1000);
+        }
+    }
+
+    function stopPolling() {
+        if (pollTimer !== null) {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+    }
+
+    function connect() {
+        const source = new EventSource(table.dataset.streamUrl);
+        source.addEventListener('open', stopPolling);
+        source.addEventListener('snapshot', function(e) {
+            applySnapshot(JSON.parse(e.data));
+        });
+        source.addEventListener('update', function(e) {
+            const data = JSON.parse(e.data);
+            if (isAdmin) {
+                applyDelta(data);
+            } else {
+                applyOwnEntry(data);
+            }
+        });
+        source.addEventListener('error', function() {
+            // A refused stream (503 when the worker is at its cap) closes for good:
+            // poll the snapshot meanwhile and ask for a stream again later
+            if (source.readyState === EventSource.CLOSED) {
+                startPolling();
+                setTimeout(connect, 30000);
+            }
+        });
+    }
+
+    connect();
+});
@@ -0,0 +1,143 @@
+"""Engine configuration for SQLite and server databases.
+
+init_storage(app) fills in SQLALCHEMY_ENGINE_OPTIONS before db.init_app.
+
+For a SQLite file every new connection is switched to WAL, so readers no
+longer block the writer or each other. It also gets busy_timeout, the
+synchronous level and the page cache size from the config. Connections
+are pooled (SQLAlchemy 1.4 would otherwise open one per checkout) and
+shared between threads.
+
+SQLite allows one writer at a time. Left alone, threads that write at
+once spin in SQLite's busy handler until one gets the lock or the timeout
+runs out with "database is locked". With SQLITE_SERIALIZE_WRITES each
+process instead queues its writers on a lock. A connection takes the lock
+at the first statement that writes and releases it when it commits or
+rolls back, so within a worker a write transaction never waits on SQLite.
+Reads never take the lock. Between workers SQLite's own locking and
+busy_timeout still apply.
+
+For other databases the DATABASE_POOL_* settings size the connection pool.
+"""
+import sqlite3
+import threading
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+
+def _is_write(statement):
+    return statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+
+def _connection_class(pragmas, writer_lock, lock_timeout):
+    class Cursor(sqlite3.Cursor):
+        def execute(self, statement, parameters=()):
+            if _is_write(statement):
+                self.connection.begin_write()
+            return super().execute(statement, parameters)
+
+        def executemany(self, statement, seq_of_parameters):
+            if _is_write(statement):
+                self.connection.begin_write()
+            return super().executemany(statement, seq_of_parameters)
+
+    class Connection(sqlite3.Connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.holds_writer_lock = False
+            for pragma in pragmas:
+                super().execute(pragma)
+
+        def cursor(self, factory=Cursor):
+            return super().cursor(factory)
+
+        def begin_write(self):
+            if writer_lock is None or self.holds_writer_lock:
+                return
+            started = time.perf_counter()
+            if not writer_lock.acquire(timeout=lock_timeout):
+                raise sqlite3.OperationalError('database is locked (timed out waiting for the writer lock)')
+            self.holds_writer_lock = True
+            from extensions import metrics
+            metrics.lock_seconds.observe(time.perf_counter() - started, 'writer_queue')
+
+        def end_write(self):
+            if self.holds_writer_lock:
+                self.holds_writer_lock = False
+                writer_lock.release()
+
+        def commit(self):
+            try:
+                super().commit()
+            finally:
+                self.end_write()
+
+        def rollback(self):
+            try:
+                super().rollback()
+            finally:
+                self.end_write()
+
+        def close(self):
+            try:
+                super().close()
+            finally:
+                self.end_write()
+
+    return Connection
+
+
+def sqlite_engine_options(config):
+    busy_timeout_ms = config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    synchronous = str(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    if synchronous not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError(f'SQLITE_SYNCHRONOUS must be OFF, NORMAL, FULL or EXTRA, not {synchronous!r}')
+    pragmas = [
+        f'PRAGMA busy_timeout = {int(busy_timeout_ms)}',
+        f'PRAGMA synchronous = {synchronous}',
+        f'PRAGMA cache_size = -{int(config.get("SQLITE_CACHE_SIZE_KB", 20000))}',
+        'PRAGMA temp_store = MEMORY',
+    ]
+    if config.get('SQLITE_WAL', True):
+        pragmas.insert(0, 'PRAGMA journal_mode = WAL')
+    writer_lock = threading.Lock() if config.get('SQLITE_SERIALIZE_WRITES', True) else None
+    return {
+        'poolclass': QueuePool,
+        'pool_size': config.get('DATABASE_POOL_SIZE') or 10,
+        'max_overflow': config.get('DATABASE_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DATABASE_POOL_TIMEOUT', 30),
+        'connect_args': {
+            'timeout': busy_timeout_ms / 1000,
+            'check_same_thread': False,
+            'factory': _connection_class(pragmas, writer_lock, busy_timeout_ms / 1000),
+        },
+    }
+
+
+def server_engine_options(config):
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': config.get('DATABASE_POOL_RECYCLE', 1800),
+        'pool_timeout': config.get('DATABASE_POOL_TIMEOUT', 30),
+        'max_overflow': config.get('DATABASE_MAX_OVERFLOW', 10),
+    }
+    if config.get('DATABASE_POOL_SIZE'):
+        options['pool_size'] = config['DATABASE_POOL_SIZE']
+    return options
+
+
+def init_storage(app):
+    """Derive engine options from the database URL; explicit SQLALCHEMY_ENGINE_OPTIONS win."""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        if not url.database or url.database == ':memory:' or not app.config.get('SQLITE_TUNING', True):
+            return  # In-memory databases live and die with their one connection
+        options = sqlite_engine_options(app.config)
+    else:
+        options = server_engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
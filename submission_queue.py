@@ -0,0 +1,148 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import insert, select
+
+logger = logging.getLogger(__name__)
+
+
+class SubmissionQueue:
+    """Write-behind buffer for incorrect submissions.
+
+    Wrong guesses are put on a bounded in-process queue and written by a
+    background thread as multi-row inserts, one transaction per batch that
+    also bumps the dashboard's attempt counters. A batch is flushed once it
+    holds SUBMISSION_FLUSH_SIZE rows or its first row has waited
+    SUBMISSION_FLUSH_INTERVAL seconds. When the queue is full new rows
+    are dropped and counted rather than blocking the request. Rows for a
+    challenge deleted while they waited are discarded at write time. The writer
+    thread starts lazily so that it runs in each worker after a fork, and the
+    queue is drained at interpreter exit.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.batch_size = 500
+        self.flush_interval = 0.5
+        self._queue = queue.Queue(maxsize=10000)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.discarded = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SUBMISSION_WRITE_BEHIND', True)
+        self.batch_size = app.config.get('SUBMISSION_FLUSH_SIZE', 500)
+        self.flush_interval = app.config.get('SUBMISSION_FLUSH_INTERVAL', 0.5)
+        self._queue = queue.Queue(maxsize=app.config.get('SUBMISSION_QUEUE_SIZE', 10000))
+        app.extensions['submission_queue'] = self
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'discarded': self.discarded,
+        }
+
+    def put(self, row):
+        """Queue one submission row. Returns False if it had to be dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Forked from a parent that had its own writer; rows queued
+                # there belong to the parent
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._pid = os.getpid()
+                atexit.register(self.drain)
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                row = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = 0 if self._stopping.is_set() else deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        from extensions import db, dashboard_stats
+        from models import Challenge, Submission
+
+        with self.app.app_context():
+            try:
+                # delete_challenge has already taken its attempts off the counters
+                challenge = Challenge.__table__
+                existing = {challenge_id for challenge_id, in db.session.execute(
+                    select(challenge.c.id).where(challenge.c.id.in_({row['challenge_id'] for row in batch}))
+                )}
+                rows = [row for row in batch if row['challenge_id'] in existing]
+                if rows:
+                    db.session.execute(insert(Submission.__table__), rows)
+                    dashboard_stats.attempts_recorded(Counter(row['challenge_id'] for row in rows))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self.failed += len(batch)
+                logger.exception('Failed to write %d queued submissions', len(batch))
+                return
+        with self._lock:
+            self.written += len(rows)
+            self.discarded += len(batch) - len(rows)
+
+    def drain(self, timeout=10):
+        """Flush everything still queued and stop the writer thread."""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        thread.join(timeout)
@@ -0,0 +1,226 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import scoring
+
+CORRECT = 'correct'
+INCORRECT = 'incorrect'
+ALREADY_SOLVED = 'already_solved'
+
+# rescored: other users whose score a dynamic challenge's decay just moved
+SubmissionResult = namedtuple('SubmissionResult', ['status', 'points', 'score', 'rescored'], defaults=[()])
+_ChallengeKey = namedtuple('_ChallengeKey', ['digest', 'points', 'minimum_points', 'decay'])
+
+
+class SubmissionEngine:
+    """Flag checking and solve recording for the challenge route and the API.
+
+    Correct solves are written synchronously; incorrect attempts go through
+    the write-behind SubmissionQueue when it is enabled. Flags are compared
+    as keyed SHA-256 digests with hmac.compare_digest, so the comparison
+    time doesn't depend on how much of the flag is right.
+    Digests and each user's solved set are cached per process. The attempts
+    of one call are recorded as one transaction: each submission insert is
+    guarded by the uq_submission_solve partial unique index and the score is
+    bumped with a relative UPDATE, so parallel correct submissions can only
+    count once. The dashboard counters, the score timeline and, for dynamic
+    challenges, the solve count and the earlier solvers' scores are updated
+    in the same transaction.
+
+    Solved sets also drive the challenge grid, so they expire after
+    SOLVED_CACHE_SECONDS: a solve shows up at once in the worker that
+    recorded it and within that time in the others.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._secret = b''
+        self._challenges = {}  # challenge_id -> _ChallengeKey
+        self._solved = {}  # user_id -> (expires_at, frozenset of solved challenge ids)
+        self.solved_ttl = 5.0
+        self.max_solved = 10000
+        self._catalog_version = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._secret = app.config['SECRET_KEY'].encode('utf-8')
+        self.solved_ttl = app.config.get('SOLVED_CACHE_SECONDS', self.solved_ttl)
+        self.max_solved = app.config.get('IDENTITY_CACHE_SIZE', self.max_solved)
+        app.extensions['submissions'] = self
+
+    def digest(self, flag):
+        return hmac.new(self._secret, flag.encode('utf-8'), hashlib.sha256).digest()
+
+    def invalidate(self, challenge_id=None):
+        """Forget cached flag digests (and solved sets when a challenge goes away)."""
+        with self._lock:
+            if challenge_id is None:
+                self._challenges.clear()
+                self._solved.clear()
+            else:
+                self._challenges.pop(challenge_id, None)
+
+    def _expire(self):
+        from extensions import catalog
+
+        # Challenge edits made in any worker bump the shared catalog version
+        version, _ = catalog.version()
+        if version != self._catalog_version:
+            with self._lock:
+                self._challenges.clear()
+                self._catalog_version = version
+
+    def challenge_key(self, challenge_id):
+        from extensions import db
+        from models import Challenge
+
+        self._expire()
+        key = self._challenges.get(challenge_id)
+        if key is None:
+            row = db.session.query(
+                Challenge.flag, Challenge.points, Challenge.minimum_points, Challenge.decay
+            ).filter(Challenge.id == challenge_id).first()
+            if row is None:
+                return None
+            decay = row.decay if row.minimum_points is not None and row.decay else None
+            key = _ChallengeKey(self.digest(row.flag), row.points, row.minimum_points, decay)
+            with self._lock:
+                self._challenges[challenge_id] = key
+        return key
+
+    def solved(self, user_id):
+        """Return the frozenset of challenge ids user_id has solved."""
+        from extensions import db
+        from models import Submission
+
+        entry = self._solved.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        rows = db.session.query(Submission.challenge_id).filter_by(user_id=user_id, is_correct=True).all()
+        solved = frozenset(challenge_id for challenge_id, in rows)
+        if self.solved_ttl > 0:
+            with self._lock:
+                if len(self._solved) >= self.max_solved:
+                    self._evict()
+                self._solved[user_id] = (time.monotonic() + self.solved_ttl, solved)
+        return solved
+
+    def _evict(self):
+        now = time.monotonic()
+        for user_id in [user_id for user_id, (expires_at, _) in self._solved.items() if expires_at <= now]:
+            del self._solved[user_id]
+        if len(self._solved) >= self.max_solved:
+            self._solved.clear()
+
+    def _mark_solved(self, user_id, challenge_ids):
+        # Sets are replaced, not changed, as requests may be reading them
+        with self._lock:
+            entry = self._solved.get(user_id)
+            if entry is not None:
+                self._solved[user_id] = (entry[0], entry[1].union(challenge_ids))
+
+    def submit(self, user, challenge_id, submitted_flag):
+        """Check a flag and record the attempt. Returns None for unknown challenges."""
+        return self.submit_many(user, [(challenge_id, submitted_flag)])[0]
+
+    def submit_many(self, user, attempts):
+        """Check (challenge_id, flag) attempts by one user and record them in one transaction.
+
+        Returns one SubmissionResult per attempt, in order, or None for
+        unknown challenges. Every result carries the user's score after the
+        whole batch and rescored lists everyone a decay moved.
+        """
+        from extensions import db
+
+        try:
+            return self._submit_many(user, attempts)
+        except IntegrityError:
+            # Another request by this user recorded one of these solves first; retry
+            # against their solves from the database
+            db.session.rollback()
+            with self._lock:
+                self._solved.pop(user.id, None)
+        try:
+            return self._submit_many(user, attempts)
+        except IntegrityError:
+            db.session.rollback()
+            raise
+
+    def _submit_many(self, user, attempts):
+        from extensions import db, submission_queue, dashboard_stats, score_timeline, user_cache
+        from models import User, Submission
+
+        solved = self.solved(user.id)
+        score = user.score or 0
+        outcomes, solves, rescored, incorrect, queued = [], [], set(), Counter(), []
+        for challenge_id, submitted_flag in attempts:
+            key = self.challenge_key(challenge_id)
+            if key is None:
+                outcomes.append(None)
+                continue
+            if challenge_id in solved or challenge_id in solves:
+                outcomes.append((ALREADY_SOLVED, 0))
+                continue
+
+            is_correct = hmac.compare_digest(self.digest(submitted_flag), key.digest)
+            submitted_at = datetime.utcnow()
+            if not is_correct and submission_queue.enabled:
+                # Queued only once the batch commits, so a retried batch doesn't queue them twice
+                queued.append({
+                    'user_id': user.id,
+                    'challenge_id': challenge_id,
+                    'submitted_flag': submitted_flag,
+                    'is_correct': False,
+                    'submitted_at': submitted_at
+                })
+                outcomes.append((INCORRECT, 0))
+                continue
+
+            db.session.execute(insert(Submission.__table__).values(
+                user_id=user.id,
+                challenge_id=challenge_id,
+                submitted_flag=submitted_flag,
+                is_correct=is_correct,
+                submitted_at=submitted_at
+            ))
+            if not is_correct:
+                incorrect[challenge_id] += 1
+                outcomes.append((INCORRECT, 0))
+                continue
+            points, moved = scoring.record_solve(challenge_id, user.id, key, counted=user.role != 'admin')
+            db.session.execute(
+                update(User.__table__).where(User.id == user.id).values(score=User.score + points)
+            )
+            dashboard_stats.solve_recorded(challenge_id, user.id, submitted_at)
+            solves.append(challenge_id)
+            rescored.update(moved)
+            outcomes.append((CORRECT, points))
+
+        if incorrect:
+            dashboard_stats.attempts_recorded(incorrect)
+        if solves:
+            score_timeline.record([user.id])
+            # Decay from solves in other workers may have moved it since user was loaded
+            score = db.session.execute(select(User.score).where(User.id == user.id)).scalar()
+        if solves or incorrect:
+            db.session.commit()
+        for row in queued:
+            submission_queue.put(row)
+
+        if solves:
+            self._mark_solved(user.id, solves)
+        for user_id in (user.id, *rescored) if solves else ():
+            user_cache.invalidate(user_id)
+        rescored = tuple(rescored)
+        return [
+            None if outcome is None else SubmissionResult(outcome[0], outcome[1], score, rescored)
+            for outcome in outcomes
+        ]
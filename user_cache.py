@@ -0,0 +1,64 @@
+import threading
+import time
+
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class UserCache:
+    """Short-lived cache of the users behind Flask-Login sessions.
+
+    load_user runs on every authenticated request; with the cache it costs
+    no query for IDENTITY_CACHE_SECONDS after a user was last read. Cached
+    column values are turned back into a User with make_transient_to_detached
+    and attached to the request's session with merge(load=False), so lazy
+    loads and later updates behave as if the row had been queried. Code that
+    changes a user's role or score calls invalidate() after committing; other
+    workers pick the change up when the entry expires, or sooner when the
+    scoreboard poller sees the new score.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 5.0
+        self.max_size = 10000
+        self._entries = {}  # user_id -> (expires_at, column values)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_SECONDS', self.ttl)
+        self.max_size = app.config.get('IDENTITY_CACHE_SIZE', self.max_size)
+        app.extensions['user_cache'] = self
+
+    def load(self, user_id):
+        from extensions import db
+        from models import User
+
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            user = User(**entry[1])
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(User, user_id)
+        if user is not None and self.ttl > 0:
+            values = {column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs}
+            with self._lock:
+                if len(self._entries) >= self.max_size:
+                    self._evict()
+                self._entries[user_id] = (time.monotonic() + self.ttl, values)
+        return user
+
+    def _evict(self):
+        now = time.monotonic()
+        for user_id in [user_id for user_id, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[user_id]
+        if len(self._entries) >= self.max_size:
+            self._entries.clear()
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
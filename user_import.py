@@ -0,0 +1,100 @@
+"""Bulk account creation for `flask users import`.
+
+Accounts are read from CSV (with a header row) or JSONL, each with
+username, email, password and optionally role. They are validated with
+the same rules as the register form. They are checked once against the
+existing case-insensitive usernames and emails and against each other.
+The accepted passwords are hashed across a process pool and the rows
+inserted in batches, one transaction each.
+"""
+import csv
+import json
+import multiprocessing
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+ROLES = {'user', 'admin'}
+EMAIL = re.compile(r'[^@]+@[^@]+\.[^@]+')
+
+ImportRow = namedtuple('ImportRow', ['line', 'username', 'email', 'password', 'role'])
+
+
+def read_records(path, format=None):
+    """Yield (line number, record dict or None if unreadable) for a CSV or JSONL file."""
+    format = format or ('jsonl' if path.lower().endswith(('.jsonl', '.json')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield number, record if isinstance(record, dict) else None
+
+
+def validate(line, record):
+    """Return (ImportRow, None) or (None, reason) using the register form's rules."""
+    if record is None:
+        return None, 'not a valid record'
+    username = str(record.get('username') or '').strip()
+    email = str(record.get('email') or '').strip().lower()
+    password = str(record.get('password') or '')
+    role = str(record.get('role') or 'user').strip().lower()
+    if not all([username, email, password]):
+        return None, 'username, email and password are required'
+    if len(username) < 3 or len(username) > 20:
+        return None, 'username must be between 3 and 20 characters'
+    if not EMAIL.match(email):
+        return None, 'invalid email address'
+    if len(password) < 8:
+        return None, 'password must be at least 8 characters long'
+    if role not in ROLES:
+        return None, f'unknown role {role!r}'
+    return ImportRow(line, username, email, password, role), None
+
+
+def plan(records, existing_usernames, existing_emails):
+    """Split records into (accepted rows, [(line, reason)] rejected) in one pass.
+
+    existing_usernames and existing_emails hold lower-cased values already
+    in the database; they are extended with every accepted row so later
+    duplicates in the same file are rejected too.
+    """
+    accepted, rejected = [], []
+    for line, record in records:
+        row, reason = validate(line, record)
+        if row is None:
+            rejected.append((line, reason))
+        elif row.username.lower() in existing_usernames:
+            rejected.append((line, f'username {row.username} already exists'))
+        elif row.email in existing_emails:
+            rejected.append((line, f'email {row.email} already registered'))
+        else:
+            existing_usernames.add(row.username.lower())
+            existing_emails.add(row.email)
+            accepted.append(row)
+    return accepted, rejected
+
+
+def _hash(password):
+    return generate_password_hash(password)
+
+
+def hash_passwords(rows, workers=None, chunksize=32):
+    """Yield (row, password hash) in order, hashing across a process pool."""
+    if workers == 1:
+        for row in rows:
+            yield row, _hash(row.password)
+        return
+    # spawn, as for media derivatives: the caller may have threads of its own
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield from zip(rows, executor.map(_hash, [row.password for row in rows], chunksize=chunksize))